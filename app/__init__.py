@@ -17,7 +17,7 @@ login_manager = LoginManager()
 mail = Mail()
 csrf = CSRFProtect()
 
-def create_app():
+def create_app(test_config=None):
     app = Flask(__name__, instance_path=None, instance_relative_config=False)
     
     # Конфигурация из переменных окружения
@@ -31,8 +31,9 @@ def create_app():
     if not os.path.exists(db_dir):
         os.makedirs(db_dir, exist_ok=True)
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-    
-
+    # PRAGMA для каждого соединения SQLite (WAL, busy_timeout, mmap и т.д.)
+    from .utils.sqlite import build_sqlite_pragmas, register_sqlite_pragmas
+    app.config['SQLITE_PRAGMAS'] = build_sqlite_pragmas(os.environ)
     
     # Конфигурация загрузки файлов
     app.config['UPLOAD_FOLDER'] = os.getenv('UPLOAD_FOLDER', 'app/static/uploads')
@@ -58,6 +59,22 @@ def create_app():
     app.config['YOOKASSA_SHOP_ID'] = os.getenv('YOOKASSA_SHOP_ID', 'your-shop-id')
     app.config['YOOKASSA_SECRET_KEY'] = os.getenv('YOOKASHA_SECRET_KEY', 'your-secret-key')
     app.config['YOOKASSA_TEST_MODE'] = os.getenv('YOOKASSA_TEST_MODE', 'True').lower() == 'true'
+    app.config['YOOKASSA_API_URL'] = os.getenv('YOOKASSA_API_URL', 'https://api.yookassa.ru/v3')
+    # Таймауты (в секундах), повторы и размер пула HTTP-соединений к ЮKassa
+    app.config['YOOKASSA_CONNECT_TIMEOUT'] = float(os.getenv('YOOKASSA_CONNECT_TIMEOUT', 3.05))
+    app.config['YOOKASSA_READ_TIMEOUT'] = float(os.getenv('YOOKASSA_READ_TIMEOUT', 10))
+    app.config['YOOKASSA_MAX_RETRIES'] = int(os.getenv('YOOKASSA_MAX_RETRIES', 3))
+    app.config['YOOKASSA_RETRY_BACKOFF'] = float(os.getenv('YOOKASSA_RETRY_BACKOFF', 0.5))
+    app.config['YOOKASSA_POOL_SIZE'] = int(os.getenv('YOOKASSA_POOL_SIZE', 10))
+    # Фоновая обработка входящих webhook'ов ЮKassa
+    app.config['PAYMENT_WEBHOOK_INTERVAL'] = int(os.getenv('PAYMENT_WEBHOOK_INTERVAL', 5))
+    app.config['PAYMENT_WEBHOOK_BATCH_SIZE'] = int(os.getenv('PAYMENT_WEBHOOK_BATCH_SIZE', 100))
+    # Фоновая сверка pending-платежей с ЮKassa и кеш статусов для страниц
+    app.config['PAYMENT_RECONCILE_INTERVAL'] = int(os.getenv('PAYMENT_RECONCILE_INTERVAL', 60))
+    app.config['PAYMENT_RECONCILE_CONCURRENCY'] = int(os.getenv('PAYMENT_RECONCILE_CONCURRENCY', 4))
+    app.config['PAYMENT_RECONCILE_BATCH_SIZE'] = int(os.getenv('PAYMENT_RECONCILE_BATCH_SIZE', 200))
+    app.config['PAYMENT_RECONCILE_MAX_AGE_HOURS'] = int(os.getenv('PAYMENT_RECONCILE_MAX_AGE_HOURS', 24))
+    app.config['PAYMENT_STATUS_CACHE_TTL'] = int(os.getenv('PAYMENT_STATUS_CACHE_TTL', 5))
     
     # Цены подписки
     app.config['SUBSCRIPTION_PRICES'] = {
@@ -67,11 +84,78 @@ def create_app():
         '12': float(os.getenv('SUBSCRIPTION_PRICE_12', 469.00))
     }
     app.config['SUBSCRIPTION_CURRENCY'] = os.getenv('SUBSCRIPTION_CURRENCY', 'RUB')
+    # Время жизни кеша статуса подписки (в секундах)
+    app.config['SUBSCRIPTION_CACHE_TTL'] = int(os.getenv('SUBSCRIPTION_CACHE_TTL', 60))
+    # Период фоновой проверки истекших подписок (в секундах)
+    app.config['SUBSCRIPTION_SWEEP_INTERVAL'] = int(os.getenv('SUBSCRIPTION_SWEEP_INTERVAL', 300))
+    
+    # Размер страницы списков пользователей в админке
+    app.config['ADMIN_USERS_PAGE_SIZE'] = int(os.getenv('ADMIN_USERS_PAGE_SIZE', 50))
+    
+    # Время жизни кеша коротких ссылок для редиректов (в секундах) и период
+    # проверки версии кеша в БД (сек): изменения ссылок в других процессах
+    # сбрасывают кеш не позже чем через SHORTLINK_CACHE_SYNC_INTERVAL
+    app.config['SHORTLINK_CACHE_TTL'] = int(os.getenv('SHORTLINK_CACHE_TTL', 60))
+    app.config['SHORTLINK_CACHE_SYNC_INTERVAL'] = float(os.getenv('SHORTLINK_CACHE_SYNC_INTERVAL', 1.0))
+    # Буфер кликов коротких ссылок: период записи в БД (сек) и порог досрочной записи
+    app.config['SHORTLINK_CLICK_FLUSH_INTERVAL'] = int(os.getenv('SHORTLINK_CLICK_FLUSH_INTERVAL', 5))
+    app.config['SHORTLINK_CLICK_FLUSH_THRESHOLD'] = int(os.getenv('SHORTLINK_CLICK_FLUSH_THRESHOLD', 1000))
+    # Период почасовой свертки событий переходов для аналитики (сек)
+    app.config['SHORTLINK_ROLLUP_INTERVAL'] = int(os.getenv('SHORTLINK_ROLLUP_INTERVAL', 60))
+    # Ключ перестановки номеров в коды ссылок (по умолчанию SECRET_KEY)
+    app.config['SHORTLINK_CODE_KEY'] = os.getenv('SHORTLINK_CODE_KEY', app.config['SECRET_KEY'])
+    # Обслуживать /l/<code> облегченным WSGI-приложением (app/redirect_app.py)
+    app.config['SHORTLINK_FAST_PATH'] = os.getenv('SHORTLINK_FAST_PATH', 'True').lower() == 'true'
+    # Фильтр Блума кодов ссылок: отказ по неизвестным кодам без запросов к БД;
+    # коды других воркеров догружаются раз в SHORTLINK_CODE_FILTER_REFRESH секунд
+    app.config['SHORTLINK_CODE_FILTER'] = os.getenv('SHORTLINK_CODE_FILTER', 'True').lower() == 'true'
+    app.config['SHORTLINK_CODE_FILTER_REFRESH'] = float(os.getenv('SHORTLINK_CODE_FILTER_REFRESH', 1.0))
+    # Массовое создание коротких ссылок: строк в запросе и строк в одной транзакции
+    app.config['SHORTLINK_BULK_MAX_ROWS'] = int(os.getenv('SHORTLINK_BULK_MAX_ROWS', 10000))
+    app.config['SHORTLINK_BULK_BATCH_SIZE'] = int(os.getenv('SHORTLINK_BULK_BATCH_SIZE', 500))
+    # Повторное сокращение того же URL без ограничений возвращает существующий код
+    app.config['SHORTLINK_DEDUP'] = os.getenv('SHORTLINK_DEDUP', 'False').lower() == 'true'
+    # Архив мертвых ссылок: период переноса (сек), через сколько часов после истечения
+    # переносить ссылку и сколько дней код выдерживается до повторной выдачи (0 - никогда)
+    app.config['SHORTLINK_SWEEP_INTERVAL'] = int(os.getenv('SHORTLINK_SWEEP_INTERVAL', 3600))
+    app.config['SHORTLINK_ARCHIVE_GRACE_HOURS'] = int(os.getenv('SHORTLINK_ARCHIVE_GRACE_HOURS', 24))
+    app.config['SHORTLINK_CODE_QUARANTINE_DAYS'] = int(os.getenv('SHORTLINK_CODE_QUARANTINE_DAYS', 30))
+    
+    # Поток сообщений чата (SSE, /chat/stream). Каждое соединение занимает
+    # поток воркера, поэтому поток включается только при известном числе потоков
+    # воркера (WORKER_THREADS, как gunicorn --threads; для gevent - worker_connections),
+    # а соединений на процесс не больше половины потоков. Время жизни соединения
+    # и интервал keepalive (сек), период проверки БД на сообщения из других воркеров (сек)
+    app.config['WORKER_THREADS'] = int(os.getenv('WORKER_THREADS', 0))
+    stream_slots = app.config['WORKER_THREADS'] // 2
+    app.config['CHAT_STREAM_ENABLED'] = (os.getenv('CHAT_STREAM_ENABLED') or str(stream_slots > 0)).lower() == 'true'
+    app.config['CHAT_STREAM_MAX_SUBSCRIBERS'] = int(os.getenv('CHAT_STREAM_MAX_SUBSCRIBERS') or stream_slots)
+    app.config['CHAT_STREAM_MAX_AGE'] = int(os.getenv('CHAT_STREAM_MAX_AGE', 300))
+    app.config['CHAT_STREAM_KEEPALIVE'] = int(os.getenv('CHAT_STREAM_KEEPALIVE', 15))
+    app.config['CHAT_STREAM_POLL_INTERVAL'] = float(os.getenv('CHAT_STREAM_POLL_INTERVAL', 1.0))
+    
+    # Время жизни кеша пользователей для Flask-Login (в секундах) и период
+    # проверки версии кеша в БД (сек): права администратора, удаление и подписка,
+    # измененные в другом процессе, видны не позже чем через USER_CACHE_SYNC_INTERVAL
+    app.config['USER_CACHE_TTL'] = int(os.getenv('USER_CACHE_TTL', 5))
+    app.config['USER_CACHE_SYNC_INTERVAL'] = float(os.getenv('USER_CACHE_SYNC_INTERVAL', 1.0))
+    
+    # Фоновые задачи (сброс подписок и т.п.) внутри процесса приложения
+    app.config['BACKGROUND_TASKS_ENABLED'] = os.getenv('BACKGROUND_TASKS_ENABLED', 'True').lower() == 'true'
+    # Общие задачи выполняет один процесс - владелец блокировки этого файла
+    # (по умолчанию во временном каталоге, свой для каждой БД); остальные
+    # раз в BACKGROUND_TASKS_LEADER_RETRY секунд проверяют, не освободилась ли она
+    app.config['BACKGROUND_TASKS_LOCK_FILE'] = os.getenv('BACKGROUND_TASKS_LOCK_FILE', '')
+    app.config['BACKGROUND_TASKS_LEADER_RETRY'] = int(os.getenv('BACKGROUND_TASKS_LEADER_RETRY', 30))
     
     # Настройки логирования
     app.config['LOG_FILE'] = os.getenv('LOG_FILE', 'logs/app.log')
     app.config['LOG_LEVEL'] = os.getenv('LOG_LEVEL', 'INFO')
     
+    # Переопределения конфигурации (тесты, бенчмарки)
+    if test_config:
+        app.config.update(test_config)
+    
     # Настройка логирования
     # Создаем директорию для логов если её нет
     log_dir = os.path.dirname(app.config['LOG_FILE'])
@@ -94,19 +178,42 @@ def create_app():
     
     app.logger.info('Приложение запущено')
     
+    # Поток чата с нулевым лимитом соединений (/chat/stream ограничивает его
+    # половиной WORKER_THREADS) отвечал бы 503 на каждое подключение
+    stream_limit = app.config['CHAT_STREAM_MAX_SUBSCRIBERS']
+    if app.config['WORKER_THREADS']:
+        stream_limit = min(stream_limit, app.config['WORKER_THREADS'] // 2)
+    if app.config['CHAT_STREAM_ENABLED'] and stream_limit <= 0:
+        app.logger.warning(
+            'CHAT_STREAM_ENABLED включен, но лимит соединений равен нулю: задайте WORKER_THREADS '
+            '(не меньше 2) или CHAT_STREAM_MAX_SUBSCRIBERS. Поток чата отключен, чат работает опросом'
+        )
+        app.config['CHAT_STREAM_ENABLED'] = False
+    
     db.init_app(app)
     
     # Проверка подключения к базе данных и создание таблиц
     try:
         with app.app_context():
+            register_sqlite_pragmas(app, db.engine)
+            
             # Проверяем подключение
             db.engine.connect()
             app.logger.info('Database connection successful')
             
             # Принудительно создаем все таблицы
             try:
+                # Модели должны быть импортированы до create_all, иначе metadata пуста
+                from . import models  # noqa: F401
                 db.create_all()
                 app.logger.info('All tables created successfully')
+                
+                # Столбцы и индексы, добавленные в модели после создания таблиц
+                from .utils.schema import ensure_columns, ensure_indexes
+                ensure_columns()
+                ensure_indexes()
+                from .services.shortlink_service import backfill_url_hashes
+                backfill_url_hashes()
             except Exception as e:
                 app.logger.error(f'Error creating tables: {e}')
                 # Если не удалось создать таблицы, логируем ошибку но не прерываем работу
@@ -125,8 +232,45 @@ def create_app():
     login_manager.login_message = 'Пожалуйста, войдите в систему для доступа к этой странице.'
     
     from .views import bp
+    from .redirect_app import ShortlinkRedirectApp
     app.register_blueprint(bp)
     
+    # Общий для процесса клиент ЮKassa с пулом соединений
+    from .utils.payment_service import YooKassaService
+    app.extensions['yookassa'] = YooKassaService(app)
+    
+    # Фоновые задачи
+    from .utils.background import register_periodic_task
+    from .services.subscription_service import expire_subscriptions
+    from .services.webhook_service import process_webhook_events
+    register_periodic_task(app, 'subscription-expiry', expire_subscriptions, app.config['SUBSCRIPTION_SWEEP_INTERVAL'])
+    from .services.payment_status_service import reconcile_pending_payments
+    register_periodic_task(app, 'payment-webhooks', process_webhook_events, app.config['PAYMENT_WEBHOOK_INTERVAL'])
+    register_periodic_task(app, 'payment-reconcile', reconcile_pending_payments, app.config['PAYMENT_RECONCILE_INTERVAL'])
+    from .services.user_cache import sync_user_cache
+    register_periodic_task(app, 'user-cache', sync_user_cache, app.config['USER_CACHE_SYNC_INTERVAL'],
+                           per_process=True)
+    from .services.click_counter import flush_clicks
+    register_periodic_task(app, 'shortlink-clicks', flush_clicks, app.config['SHORTLINK_CLICK_FLUSH_INTERVAL'],
+                           run_at_exit=True, per_process=True)
+    from .services.shortlink_service import sync_short_link_cache
+    register_periodic_task(app, 'shortlink-cache', sync_short_link_cache, app.config['SHORTLINK_CACHE_SYNC_INTERVAL'],
+                           per_process=True)
+    from .services.code_filter import refresh_code_filter
+    register_periodic_task(app, 'shortlink-codes', refresh_code_filter, app.config['SHORTLINK_CODE_FILTER_REFRESH'],
+                           per_process=True)
+    from .services.click_analytics import rollup_clicks
+    register_periodic_task(app, 'shortlink-rollup', rollup_clicks, app.config['SHORTLINK_ROLLUP_INTERVAL'])
+    from .services.shortlink_archive import sweep_dead_links
+    register_periodic_task(app, 'shortlink-sweep', sweep_dead_links, app.config['SHORTLINK_SWEEP_INTERVAL'])
+    from .services.chat_hub import poll_new_messages
+    register_periodic_task(app, 'chat-stream', poll_new_messages, app.config['CHAT_STREAM_POLL_INTERVAL'],
+                           per_process=True)
+    
+    # Быстрый путь для /l/<code> в обход стека Flask
+    if app.config['SHORTLINK_FAST_PATH'] and not isinstance(app.wsgi_app, ShortlinkRedirectApp):
+        app.wsgi_app = ShortlinkRedirectApp(app, fallback=app.wsgi_app)
+    
     # Обработчик ошибки 404 на уровне приложения
     @app.errorhandler(404)
     def not_found(error):
@@ -137,6 +281,11 @@ def create_app():
     # Настройка заголовков кеширования для статических файлов
     @app.after_request
     def add_cache_headers(response):
+        # Явно заданный Cache-Control (no-cache для ответов с ETag, no-store для
+        # редиректов коротких ссылок) не перезаписываем; редиректы, 304 и ошибки
+        # не кешируем надолго, иначе браузер перестанет перепроверять ответ
+        if 'Cache-Control' in response.headers or response.status_code != 200:
+            return response
         if response.mimetype in ['image/png', 'image/x-icon', 'image/jpeg', 'image/gif', 'image/webp']:
             # Для иконок и изображений - короткий кеш
             response.cache_control.max_age = 300  # 5 минут
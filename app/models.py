@@ -2,25 +2,35 @@ from . import db
 from flask_login import UserMixin
 from datetime import datetime, timedelta
 import secrets
-from typing import Optional
+from typing import List, Optional
+
+from sqlalchemy.orm import validates
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(150), unique=True, nullable=False)
     password = db.Column(db.String(256), nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    is_admin = db.Column(db.Boolean, default=False)
-    is_subscribed = db.Column(db.Boolean, default=False)
-    subscription_expires = db.Column(db.DateTime)
+    is_admin = db.Column(db.Boolean, default=False, index=True)
+    is_subscribed = db.Column(db.Boolean, default=False, index=True)
+    subscription_expires = db.Column(db.DateTime, index=True)
     is_manual_subscription = db.Column(db.Boolean, default=False)  # Подписка выдана вручную администратором
-    is_verified = db.Column(db.Boolean, default=False)  # Подтверждение email
+    is_verified = db.Column(db.Boolean, default=False, index=True)  # Подтверждение email
     submissions = db.relationship('Submission', backref='user', lazy=True, cascade='all, delete-orphan')
     payments = db.relationship('Payment', backref='user', lazy=True, cascade='all, delete-orphan')
     tickets = db.relationship('Ticket', foreign_keys='Ticket.user_id', backref='user', lazy=True, cascade='all, delete-orphan')
     notifications = db.relationship('Notification', backref='user', lazy=True, cascade='all, delete-orphan')
 
+# Поиск пользователей в админке без учета регистра (lower() в SQLite - только ASCII)
+db.Index('ix_user_username_lower', db.func.lower(User.username))
+db.Index('ix_user_email_lower', db.func.lower(User.email))
+
 class EmailVerification(db.Model):
     """Модель для хранения кодов подтверждения email"""
+    __table_args__ = (
+        db.Index('ix_email_verification_user_id', 'user_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)  # Может быть NULL для временных кодов
     email = db.Column(db.String(120), nullable=True)  # Email для временных кодов
@@ -61,6 +71,11 @@ class EmailVerification(db.Model):
 
 class PasswordReset(db.Model):
     """Модель для хранения кодов восстановления пароля"""
+    __table_args__ = (
+        db.Index('ix_password_reset_code_used', 'code', 'is_used'),
+        db.Index('ix_password_reset_email_used', 'email', 'is_used'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), nullable=False)  # Email пользователя
     code = db.Column(db.String(8), nullable=False)  # 8-символьный код
@@ -102,6 +117,10 @@ class Subject(db.Model):
     materials = db.relationship('Material', backref='subject', lazy=True)
 
 class Material(db.Model):
+    __table_args__ = (
+        db.Index('ix_material_subject_type', 'subject_id', 'type'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(255), nullable=False)
     description = db.Column(db.Text)
@@ -115,6 +134,11 @@ class Material(db.Model):
     submissions = db.relationship('Submission', backref='material', lazy=True, cascade="all, delete-orphan")
 
 class Submission(db.Model):
+    __table_args__ = (
+        db.Index('ix_submission_user_material', 'user_id', 'material_id'),
+        db.Index('ix_submission_material_id', 'material_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     material_id = db.Column(db.Integer, db.ForeignKey('material.id'), nullable=False)
@@ -124,6 +148,11 @@ class Submission(db.Model):
 
 class Payment(db.Model):
     """Модель для хранения информации о платежах"""
+    __table_args__ = (
+        db.Index('ix_payment_user_created', 'user_id', 'created_at'),
+        db.Index('ix_payment_status_created', 'status', 'created_at'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     yookassa_payment_id = db.Column(db.String(255), unique=True, nullable=False)
@@ -137,8 +166,29 @@ class Payment(db.Model):
     def __repr__(self) -> str:
         return f'<Payment {self.yookassa_payment_id}: {self.status}>'
 
+class PaymentWebhookEvent(db.Model):
+    """Входящие webhook-уведомления ЮKassa, ожидающие обработки"""
+    __table_args__ = (
+        db.UniqueConstraint('event', 'payment_id', name='uq_payment_webhook_event'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    event = db.Column(db.String(64), nullable=False)  # payment.succeeded, payment.canceled, ...
+    payment_id = db.Column(db.String(255), nullable=False)  # ID платежа в ЮKassa
+    status = db.Column(db.String(20))
+    paid = db.Column(db.Boolean, default=False)
+    received_at = db.Column(db.DateTime, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime, index=True)  # NULL - еще не обработано
+
+    def __repr__(self) -> str:
+        return f'<PaymentWebhookEvent {self.event}: {self.payment_id}>'
+
 class ChatMessage(db.Model):
     """Модель для хранения сообщений чата"""
+    __table_args__ = (
+        db.Index('ix_chat_message_created_at', 'created_at'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     message = db.Column(db.Text, nullable=False)
@@ -155,6 +205,11 @@ class ChatMessage(db.Model):
 
 class Ticket(db.Model):
     """Модель для хранения тикетов поддержки"""
+    __table_args__ = (
+        db.Index('ix_ticket_user_created', 'user_id', 'created_at'),
+        db.Index('ix_ticket_created_at', 'created_at'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     subject = db.Column(db.String(255), nullable=False)
@@ -179,6 +234,10 @@ class Ticket(db.Model):
 
 class TicketFile(db.Model):
     """Модель для хранения файлов, прикрепленных к тикетам"""
+    __table_args__ = (
+        db.Index('ix_ticket_file_ticket_id', 'ticket_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     ticket_id = db.Column(db.Integer, db.ForeignKey('ticket.id'), nullable=False)
     file_path = db.Column(db.String(255), nullable=False)
@@ -192,6 +251,11 @@ class TicketFile(db.Model):
 
 class TicketMessage(db.Model):
     """Модель для хранения сообщений в тикетах"""
+    __table_args__ = (
+        db.Index('ix_ticket_message_ticket_admin', 'ticket_id', 'is_admin'),
+        db.Index('ix_ticket_message_user_id', 'user_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     ticket_id = db.Column(db.Integer, db.ForeignKey('ticket.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -208,6 +272,10 @@ class TicketMessage(db.Model):
 
 class Notification(db.Model):
     """Модель для хранения уведомлений пользователей"""
+    __table_args__ = (
+        db.Index('ix_notification_user_read_created', 'user_id', 'is_read', 'created_at'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     title = db.Column(db.String(255), nullable=False)
@@ -226,6 +294,7 @@ class ShortLink(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     code = db.Column(db.String(16), unique=True, nullable=False, index=True)
     original_url = db.Column(db.Text, nullable=False)
+    url_hash = db.Column(db.String(64), index=True)  # sha256 original_url (поиск дубликатов)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     clicks = db.Column(db.Integer, default=0, nullable=False)
 
@@ -233,35 +302,120 @@ class ShortLink(db.Model):
         return f'<ShortLink {self.code} -> {self.original_url}>'
 
     @staticmethod
-    def generate_code(length: int = 3) -> str:
-        """Генерирует короткий код длиной length"""
-        alphabet = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
-        return ''.join(secrets.choice(alphabet) for _ in range(length))
+    def hash_url(url: str) -> str:
+        """sha256 URL в hex: ключ индекса для поиска ссылки по URL"""
+        import hashlib
+
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    @validates('original_url')
+    def _sync_url_hash(self, key: str, value: str) -> str:
+        self.url_hash = self.hash_url(value)
+        return value
+
+    @staticmethod
+    def code_for_sequence(sequence: int) -> str:
+        """Код ссылки для номера последовательности (см. utils.shortcode)"""
+        from flask import current_app
+        from .utils.shortcode import sequence_to_code
+
+        return sequence_to_code(sequence, current_app.config['SHORTLINK_CODE_KEY'].encode())
+
+    @classmethod
+    def add_with_codes(cls, links: List['ShortLink'], max_tries: int = 100) -> None:
+        """Присваивает записям коды из последовательности и добавляет их в сессию
+
+        Сначала берутся освобожденные коды архивных ссылок, прошедшие карантин
+        (ShortLinkArchive.claim_codes), остальные номера для записей
+        резервируются одним UPDATE; захват кодов и вставка идут в одном
+        SAVEPOINT. Коды разных номеров не совпадают (utils.shortcode), поэтому
+        проверочный SELECT не нужен. Конфликт возможен только со старыми
+        случайными кодами: тогда SAVEPOINT откатывается вместе с захватом
+        освобожденных кодов (они остаются доступными), и записи добавляются
+        по одной, со следующими номерами. Коммит остается за вызывающим кодом.
+        """
+        from sqlalchemy.exc import IntegrityError
+
+        if not links:
+            return
+        try:
+            with db.session.begin_nested():
+                freed = ShortLinkArchive.claim_codes(len(links))
+                for link, code in zip(links, freed):
+                    link.code = code
+                rest = links[len(freed):]
+                if rest:
+                    first = CodeSequence.next_value('short_link', len(rest))
+                    for offset, link in enumerate(rest):
+                        link.code = cls.code_for_sequence(first + offset)
+                db.session.add_all(links)
+            return
+        except IntegrityError:
+            pass
+
+        for link in links:
+            for _ in range(max_tries):
+                link.code = cls.code_for_sequence(CodeSequence.next_value('short_link'))
+                try:
+                    with db.session.begin_nested():
+                        db.session.add(link)
+                    break
+                except IntegrityError:
+                    continue
+            else:
+                raise RuntimeError('Не удалось выделить код короткой ссылки')
+
+    @classmethod
+    def allocate(cls, original_url: str, max_tries: int = 100) -> 'ShortLink':
+        """Добавляет в сессию запись с кодом из следующего номера последовательности"""
+        link = cls(original_url=original_url)
+        cls.add_with_codes([link], max_tries)
+        return link
 
     @classmethod
-    def create_unique(cls, original_url: str, max_tries: int = 5) -> 'ShortLink':
+    def create_unique(cls, original_url: str, max_tries: int = 100) -> 'ShortLink':
         """Создаёт уникальную запись с новым кодом"""
-        for _ in range(max_tries):
-            code = cls.generate_code()
-            if not cls.query.filter_by(code=code).first():
-                link = cls(code=code, original_url=original_url)
-                db.session.add(link)
-                db.session.commit()
-                return link
-        # Если по каким-то причинам код не удалось сгенерировать
-        # увеличиваем длину и пробуем ещё раз
-        code = cls.generate_code(8)
-        link = cls(code=code, original_url=original_url)
-        db.session.add(link)
+        link = cls.allocate(original_url, max_tries)
         db.session.commit()
         return link
 
 
+class CodeSequence(db.Model):
+    """Именованные последовательности (номера кодов коротких ссылок)"""
+    name = db.Column(db.String(64), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)  # Следующий свободный номер
+
+    def __repr__(self) -> str:
+        return f'<CodeSequence {self.name}={self.value}>'
+
+    @classmethod
+    def next_value(cls, name: str, count: int = 1) -> int:
+        """Атомарно резервирует count номеров и возвращает первый из них
+
+        Выполняется одним UPDATE ... RETURNING в текущей транзакции.
+        """
+        from sqlalchemy import update
+        from sqlalchemy.dialects.sqlite import insert
+
+        stmt = (
+            update(cls)
+            .where(cls.name == name)
+            .values(value=cls.value + count)
+            .returning(cls.value)
+            .execution_options(synchronize_session=False)
+        )
+        value = db.session.execute(stmt).scalar()
+        if value is None:
+            db.session.execute(insert(cls).values(name=name, value=0).on_conflict_do_nothing())
+            value = db.session.execute(stmt).scalar()
+        return value - count
+
+
 class ShortLinkRule(db.Model):
     """Политика ограничения для короткой ссылки (время/количество кликов)."""
     id = db.Column(db.Integer, primary_key=True)
     short_link_id = db.Column(db.Integer, db.ForeignKey('short_link.id'), nullable=False, unique=True)
-    expires_at = db.Column(db.DateTime, nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=True, index=True)
     max_clicks = db.Column(db.Integer, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
 
@@ -269,4 +423,87 @@ class ShortLinkRule(db.Model):
     short_link = db.relationship('ShortLink', backref=db.backref('rule', uselist=False, cascade='all, delete-orphan'))
 
     def __repr__(self) -> str:
-        return f'<ShortLinkRule link_id={self.short_link_id} expires_at={self.expires_at} max_clicks={self.max_clicks}>'
\ No newline at end of file
+        return f'<ShortLinkRule link_id={self.short_link_id} expires_at={self.expires_at} max_clicks={self.max_clicks}>'
+
+class ShortLinkClick(db.Model):
+    """Сырые события переходов по коротким ссылкам (очередь для почасовой свертки)
+
+    Строки только добавляются (пачками из буфера click_counter) и удаляются
+    после свертки в ShortLinkClickHourly. Внешнего ключа нет: события
+    удаленных ссылок отбрасываются при свертке, а не ломают запись пачки.
+    """
+    __tablename__ = 'short_link_click'
+
+    id = db.Column(db.Integer, primary_key=True)
+    short_link_id = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+    referrer_host = db.Column(db.String(255), nullable=False, default='')  # '' - прямой переход
+
+    def __repr__(self) -> str:
+        return f'<ShortLinkClick link_id={self.short_link_id} at={self.created_at}>'
+
+
+class ShortLinkClickHourly(db.Model):
+    """Почасовые агрегаты переходов: ссылка x час x источник"""
+    __tablename__ = 'short_link_click_hourly'
+
+    short_link_id = db.Column(db.Integer, db.ForeignKey('short_link.id'), primary_key=True)
+    hour = db.Column(db.DateTime, primary_key=True)  # Начало часа (UTC)
+    referrer_host = db.Column(db.String(255), primary_key=True, default='')
+    clicks = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self) -> str:
+        return f'<ShortLinkClickHourly link_id={self.short_link_id} hour={self.hour} clicks={self.clicks}>'
+
+
+class ShortLinkArchive(db.Model):
+    """Архив истекших и исчерпанных коротких ссылок (переносятся из short_link)"""
+    __tablename__ = 'short_link_archive'
+    __table_args__ = (
+        # Поиск освобожденных кодов, прошедших карантин (claim_codes)
+        db.Index('ix_short_link_archive_reusable', 'code_reused_at', 'archived_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    link_id = db.Column(db.Integer, nullable=False)  # id ссылки в short_link до переноса
+    code = db.Column(db.String(16), nullable=False, index=True)
+    original_url = db.Column(db.Text, nullable=False)
+    clicks = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False)
+    expires_at = db.Column(db.DateTime)
+    max_clicks = db.Column(db.Integer)
+    reason = db.Column(db.String(16), nullable=False)  # 'expired_time' | 'expired_clicks'
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    code_reused_at = db.Column(db.DateTime)  # Когда код отдан новой ссылке
+
+    def __repr__(self) -> str:
+        return f'<ShortLinkArchive {self.code} ({self.reason})>'
+
+    @classmethod
+    def claim_codes(cls, count: int) -> List[str]:
+        """Забирает до count кодов, освобожденных не позже SHORTLINK_CODE_QUARANTINE_DAYS дней назад
+
+        Коды помечаются одним UPDATE ... RETURNING в текущей транзакции, поэтому
+        один код не достанется двум ссылкам. При карантине 0 коды не переиспользуются.
+        """
+        from flask import current_app
+        from sqlalchemy import select, update
+
+        days = current_app.config.get('SHORTLINK_CODE_QUARANTINE_DAYS', 30)
+        if days <= 0 or count <= 0:
+            return []
+        now = datetime.utcnow()
+        candidates = (
+            select(cls.id)
+            .where(cls.code_reused_at.is_(None), cls.archived_at <= now - timedelta(days=days))
+            .order_by(cls.archived_at)
+            .limit(count)
+        )
+        stmt = (
+            update(cls)
+            .where(cls.id.in_(candidates.scalar_subquery()))
+            .values(code_reused_at=now)
+            .returning(cls.code)
+            .execution_options(synchronize_session=False)
+        )
+        return list(db.session.scalars(stmt))
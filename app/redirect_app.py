@@ -0,0 +1,98 @@
+"""
+Облегченное WSGI-приложение для редиректов коротких ссылок (GET /l/<code>)
+
+Запрос /l/<code> обслуживается напрямую через resolve_short_link (кеш ссылок,
+буфер кликов, условный UPDATE для ссылок с лимитом) без стека Flask:
+маршрутизации, context processors, загрузки пользователя Flask-Login, CSRF
+и after_request. Остальные запросы передаются в fallback.
+
+Используется двумя способами:
+    - внутри основного приложения (create_app оборачивает app.wsgi_app,
+      если SHORTLINK_FAST_PATH включен);
+    - отдельным пулом воркеров через redirect.py (gunicorn redirect:app),
+      с той же БД; кеш ссылок у каждого процесса свой, и фоновая задача
+      процесса сбрасывает его по версии кеша в БД (mark_short_links_changed),
+      когда ссылки меняются в основном приложении.
+"""
+
+import re
+from typing import Callable, Iterable, Optional
+
+from flask import Flask
+from werkzeug.urls import iri_to_uri
+
+from . import db
+from .services.shortlink_service import resolve_short_link
+
+
+# Коды ссылок: латиница, цифры, до 16 символов (ShortLink.code)
+_CODE_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,16}$")
+
+# Служебные страницы под тем же префиксом обслуживает Flask
+_RESERVED_CODES = {"expired"}
+
+
+class ShortlinkRedirectApp:
+    """
+    WSGI-приложение, отвечающее 302 на GET/HEAD /l/<code>
+
+    Args:
+        flask_app: Приложение Flask (конфигурация, БД, логгер)
+        fallback: WSGI-приложение для всех остальных запросов; без него - 404
+        prefix: Префикс коротких ссылок
+    """
+
+    def __init__(self, flask_app: Flask, fallback: Optional[Callable] = None, prefix: str = "/l/") -> None:
+        self.flask_app = flask_app
+        self.fallback = fallback
+        self.prefix = prefix
+
+    def __call__(self, environ, start_response) -> Iterable[bytes]:
+        code = self._match(environ)
+        if code is None:
+            if self.fallback is not None:
+                return self.fallback(environ, start_response)
+            start_response("404 Not Found", [("Content-Type", "text/plain"), ("Content-Length", "9")])
+            return [b"Not Found"]
+
+        with self.flask_app.app_context():
+            try:
+                url, reason = resolve_short_link(code, environ.get("HTTP_REFERER", ""))
+            except Exception as e:
+                self.flask_app.logger.error(f"shortlink: ошибка редиректа code={code}: {e}")
+                db.session.rollback()
+                start_response("500 Internal Server Error", [("Content-Length", "0")])
+                return [b""]
+            finally:
+                db.session.remove()
+
+        script_name = environ.get("SCRIPT_NAME", "")
+        if reason == "not_found":
+            location = f"{script_name}/404"
+        elif reason:
+            location = f"{script_name}{self.prefix}expired"
+        else:
+            location = iri_to_uri(url)
+
+        start_response(
+            "302 Found",
+            [
+                ("Location", location),
+                # Редирект нельзя кешировать: каждый переход должен засчитываться
+                ("Cache-Control", "no-store"),
+                ("Content-Length", "0"),
+            ],
+        )
+        return [b""]
+
+    def _match(self, environ) -> Optional[str]:
+        """Возвращает код ссылки, если запрос подходит для быстрого пути."""
+        if environ.get("REQUEST_METHOD") not in ("GET", "HEAD"):
+            return None
+        path = environ.get("PATH_INFO", "")
+        if not path.startswith(self.prefix):
+            return None
+        code = path[len(self.prefix):]
+        if code in _RESERVED_CODES or not _CODE_PATTERN.match(code):
+            return None
+        return code
@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import json
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, NamedTuple, Optional, Tuple
+
+from sqlalchemy import func, select
+
+from .. import db
+from ..models import ChatMessage
+from .chat_service import CHAT_HISTORY_LIMIT, message_payload, select_chat_messages
+
+
+class _Entry(NamedTuple):
+    id: int
+    user_id: int
+    fragment: str  # JSON сообщения без закрывающей скобки: is_own дописывается на запрос
+
+
+class ChatWindow(NamedTuple):
+    """Снимок окна последних сообщений."""
+
+    latest_id: int
+    floor: int  # Все сообщения с id > floor есть в entries
+    entries: Tuple[_Entry, ...]
+
+
+def _entry(payload: Dict[str, Any]) -> _Entry:
+    fragment = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))[:-1]
+    return _Entry(payload["id"], payload["user_id"], fragment)
+
+
+class ChatBuffer:
+    """
+    Последние сообщения чата в памяти процесса, уже закодированные в JSON
+
+    Все опрашивающие клиенты читают одно и то же окно, поэтому оно хранится
+    кольцевым буфером на capacity сообщений; send_chat_message дописывает в
+    него свое сообщение. Согласованность между воркерами проверяется на
+    каждом чтении одним запросом max(id), count(id) по диапазону первичного
+    ключа окна (не больше capacity строк): новые сообщения других воркеров
+    догружаются хвостом, а расхождение счетчика (удаленные сообщения,
+    пропуск в буфере) перезагружает окно целиком.
+    """
+
+    def __init__(self, capacity: int = CHAT_HISTORY_LIMIT) -> None:
+        self.capacity = capacity
+        self._entries: Deque[_Entry] = deque(maxlen=capacity)
+        self._floor: Optional[int] = None  # None - окно еще не загружено
+        self._lock = threading.Lock()
+
+    def _latest_id(self) -> int:
+        return self._entries[-1].id if self._entries else (self._floor or 0)
+
+    def _push(self, payload: Dict[str, Any]) -> None:
+        self._entries.append(_entry(payload))
+        if len(self._entries) == self.capacity:
+            self._floor = self._entries[0].id - 1
+
+    def append(self, payload: Dict[str, Any]) -> None:
+        """Добавляет только что сохраненное сообщение (payload из message_payload)."""
+        with self._lock:
+            if self._floor is None or payload["id"] <= self._latest_id():
+                return
+            self._push(payload)
+
+    def clear(self) -> None:
+        """Сбрасывает окно: следующее чтение загрузит его из БД."""
+        with self._lock:
+            self._entries.clear()
+            self._floor = None
+
+    def sync(self) -> ChatWindow:
+        """Сверяет окно с БД и возвращает его снимок."""
+        with self._lock:
+            if self._floor is None or not self._catch_up():
+                self._reload()
+            return ChatWindow(self._latest_id(), self._floor, tuple(self._entries))
+
+    def _catch_up(self) -> bool:
+        """Догружает новые сообщения; False, если окно нужно перезагрузить."""
+        latest, count = db.session.execute(
+            select(func.max(ChatMessage.id), func.count(ChatMessage.id)).where(ChatMessage.id > self._floor)
+        ).one()
+        known = len(self._entries)
+        if (latest or self._floor) == self._latest_id() and count == known:
+            return True
+        if not latest or latest < self._latest_id():
+            return False
+        rows = db.session.execute(
+            select_chat_messages()
+            .where(ChatMessage.id > self._latest_id())
+            .order_by(ChatMessage.id)
+            .limit(self.capacity + 1)
+        ).all()
+        if len(rows) > self.capacity or count != known + len(rows):
+            return False
+        for row in rows:
+            self._push(message_payload(row))
+        return True
+
+    def _reload(self) -> None:
+        rows = db.session.execute(
+            select_chat_messages().order_by(ChatMessage.id.desc()).limit(self.capacity)
+        ).all()
+        rows.reverse()
+        self._entries.clear()
+        self._floor = 0
+        for row in rows:
+            self._push(message_payload(row))
+
+
+def render_messages(window: ChatWindow, after_id: Optional[int], viewer_id: int) -> str:
+    """Тело ответа /chat/messages из снимка окна; на запрос вычисляется только is_own.
+
+    Без after_id или если after_id старше окна (новых сообщений больше, чем
+    в нем помещается) отдается все окно с reset: клиент перерисовывает чат.
+    """
+    reset = not after_id or after_id < window.floor
+    start = 0 if reset else after_id
+    own, other = ',"is_own":true}', ',"is_own":false}'
+    messages = ",".join(
+        entry.fragment + (own if entry.user_id == viewer_id else other)
+        for entry in window.entries
+        if entry.id > start
+    )
+    return (
+        f'{{"success":true,"latest_id":{window.latest_id},'
+        f'"reset":{"true" if reset else "false"},"messages":[{messages}]}}'
+    )
+
+
+chat_buffer = ChatBuffer()
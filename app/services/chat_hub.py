@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import queue
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Set
+
+from flask import current_app
+
+from .. import db
+from ..models import ChatMessage
+from .chat_service import message_payload, select_chat_messages
+
+
+class ChatSubscription:
+    """Очередь новых сообщений для одного SSE-соединения."""
+
+    def __init__(self, after_id: int, queue_size: int) -> None:
+        self.after_id = after_id  # Последний id, который клиент уже видел
+        self.queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=queue_size)
+
+
+class ChatHub:
+    """
+    Рассылка новых сообщений чата подписчикам /chat/stream внутри процесса
+
+    Сообщения, отправленные через этот воркер, публикуются сразу из
+    send_chat_message. Сообщения других воркеров подхватывает фоновая задача
+    poll_new_messages по id > последнего прочитанного - один запрос на процесс
+    за интервал, и только пока есть подписчики. Каждое сообщение рассылается
+    один раз (недавние id запоминаются).
+    """
+
+    def __init__(self, queue_size: int = 100, remember: int = 1000) -> None:
+        self.queue_size = queue_size
+        self._remember = remember
+        self._subscribers: Set[ChatSubscription] = set()
+        self._published: "OrderedDict[int, None]" = OrderedDict()
+        self._polled_id: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def subscribe(self, after_id: int, limit: Optional[int] = None) -> Optional[ChatSubscription]:
+        """Регистрирует подписчика, который уже видел сообщения до after_id включительно.
+
+        Возвращает None, если подписчиков уже limit.
+        """
+        subscription = ChatSubscription(after_id, self.queue_size)
+        with self._lock:
+            if limit is not None and len(self._subscribers) >= limit:
+                return None
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: ChatSubscription) -> None:
+        with self._lock:
+            self._subscribers.discard(subscription)
+            if not self._subscribers:
+                self._polled_id = None
+
+    def publish(self, payloads: Iterable[Dict[str, Any]]) -> int:
+        """Рассылает сообщения (payload из message_payload); возвращает число новых.
+
+        Подписчик, не успевающий читать очередь, отключается: клиент
+        переподключится и догрузит пропущенное по Last-Event-ID.
+        """
+        with self._lock:
+            fresh = []
+            for payload in payloads:
+                if payload["id"] in self._published:
+                    continue
+                self._published[payload["id"]] = None
+                fresh.append(payload)
+            while len(self._published) > self._remember:
+                self._published.popitem(last=False)
+            if not fresh:
+                return 0
+            for subscription in list(self._subscribers):
+                try:
+                    for payload in fresh:
+                        subscription.queue.put_nowait(payload)
+                except queue.Full:
+                    self._subscribers.discard(subscription)
+                    _close(subscription)
+        return len(fresh)
+
+    def poll(self, limit: int = 500) -> int:
+        """Публикует сообщения других воркеров: id > последнего прочитанного."""
+        with self._lock:
+            if not self._subscribers:
+                return 0
+            if self._polled_id is None:
+                self._polled_id = min(subscription.after_id for subscription in self._subscribers)
+            polled_id = self._polled_id
+        messages = db.session.execute(
+            select_chat_messages().where(ChatMessage.id > polled_id).order_by(ChatMessage.id).limit(limit)
+        ).all()
+        if not messages:
+            return 0
+        with self._lock:
+            if self._polled_id is not None:
+                self._polled_id = max(self._polled_id, messages[-1].id)
+        return self.publish(message_payload(msg) for msg in messages)
+
+    def close_all(self) -> None:
+        """Отключает всех подписчиков (клиенты переподключатся)."""
+        with self._lock:
+            subscribers, self._subscribers = self._subscribers, set()
+            self._polled_id = None
+        for subscription in subscribers:
+            _close(subscription)
+
+
+def _close(subscription: ChatSubscription) -> None:
+    # None в очереди - сигнал генератору потока завершить ответ
+    try:
+        subscription.queue.put_nowait(None)
+    except queue.Full:
+        try:
+            subscription.queue.get_nowait()
+        except queue.Empty:
+            pass
+        subscription.queue.put_nowait(None)
+
+
+chat_hub = ChatHub()
+
+
+def poll_new_messages() -> None:
+    """Фоновая задача: рассылка сообщений, записанных другими воркерами."""
+    published = chat_hub.poll()
+    if published:
+        current_app.logger.debug(f"Чат: разослано сообщений из других воркеров: {published}")
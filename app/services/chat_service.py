@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import Row, Select, func, select
+
+from .. import db
+from ..models import ChatMessage, User
+
+
+# Сколько последних сообщений отдается при открытии чата
+CHAT_HISTORY_LIMIT = 150
+
+# Колонки сообщения для чтения чата: имя автора берется JOIN-ом в том же
+# запросе, объекты ChatMessage/User не создаются и не подгружаются лениво
+CHAT_MESSAGE_COLUMNS = (
+    ChatMessage.id,
+    ChatMessage.user_id,
+    User.username,
+    ChatMessage.message,
+    ChatMessage.file_path,
+    ChatMessage.file_name,
+    ChatMessage.file_type,
+    ChatMessage.created_at,
+)
+
+
+def select_chat_messages() -> Select:
+    """SELECT колонок CHAT_MESSAGE_COLUMNS с JOIN автора (условия и порядок добавляет вызывающий)."""
+    return select(*CHAT_MESSAGE_COLUMNS).join(User, User.id == ChatMessage.user_id)
+
+
+def message_payload(row: Any, username: Optional[str] = None) -> Dict[str, Any]:
+    """Данные сообщения, общие для всех читателей (без is_own).
+
+    row - строка select_chat_messages(). Для только что созданного
+    ChatMessage передается username автора, чтобы не загружать его связь.
+    """
+    return {
+        "id": row.id,
+        "user_id": row.user_id,
+        "username": username if username is not None else row.username,
+        "message": row.message,
+        "file_path": row.file_path,
+        "file_name": row.file_name,
+        "file_type": row.file_type,
+        "created_at": row.created_at.strftime("%H:%M"),
+    }
+
+
+def serialize_message(row: Any, viewer_id: int) -> Dict[str, Any]:
+    """Сообщение чата в формате ответа /chat/messages."""
+    return with_viewer(message_payload(row), viewer_id)
+
+
+def with_viewer(payload: Dict[str, Any], viewer_id: int) -> Dict[str, Any]:
+    """Копия payload с флагом is_own для конкретного читателя."""
+    return {**payload, "is_own": payload["user_id"] == viewer_id}
+
+
+def get_latest_message_id() -> int:
+    """id последнего сообщения чата (max по первичному ключу - один шаг по индексу)."""
+    return db.session.scalar(select(func.max(ChatMessage.id))) or 0
+
+
+def get_messages(after_id: Optional[int] = None, limit: int = CHAT_HISTORY_LIMIT) -> Tuple[List[Row], bool]:
+    """Сообщения в хронологическом порядке: последние limit или только новее after_id.
+
+    Выборка идет по диапазону первичного ключа (id > after_id ORDER BY id DESC
+    LIMIT limit + 1) одним запросом вместе с именами авторов. Если новых
+    сообщений больше limit, возвращаются последние limit и признак reset:
+    клиенту нужно перерисовать чат целиком.
+
+    Returns:
+        Tuple[List[Row], bool]: (строки select_chat_messages(), reset)
+    """
+    stmt = (
+        select_chat_messages()
+        .where(ChatMessage.id > (after_id or 0))
+        .order_by(ChatMessage.id.desc())
+        .limit(limit + 1)
+    )
+    messages = list(db.session.execute(stmt))
+    reset = not after_id or len(messages) > limit
+    messages = messages[:limit]
+    messages.reverse()
+    return messages, reset
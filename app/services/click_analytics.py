@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, Iterable
+
+from flask import current_app
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.sqlite import insert
+
+from .. import db
+from ..models import ShortLink, ShortLinkClick, ShortLinkClickHourly
+
+
+def rollup_clicks(batch_size: int = 5000) -> int:
+    """Сворачивает сырые события переходов в почасовые агрегаты.
+
+    Пачка событий забирается одним DELETE ... RETURNING (первым выражением
+    транзакции, под блокировкой записи), поэтому воркеры, запустившие свертку
+    одновременно, не учтут одно событие дважды. События суммируются по
+    (ссылка, час, источник) и добавляются в short_link_click_hourly одним
+    UPSERT (clicks = clicks + excluded.clicks) в той же транзакции.
+    События удаленных ссылок отбрасываются. Возвращает число событий.
+    """
+    hourly = ShortLinkClickHourly.__table__
+    total = 0
+    while True:
+        batch_ids = select(ShortLinkClick.id).order_by(ShortLinkClick.id).limit(batch_size)
+        events = db.session.execute(
+            delete(ShortLinkClick)
+            .where(ShortLinkClick.id.in_(batch_ids.scalar_subquery()))
+            .returning(ShortLinkClick.short_link_id, ShortLinkClick.created_at, ShortLinkClick.referrer_host)
+            .execution_options(synchronize_session=False)
+        ).all()
+        if not events:
+            db.session.commit()
+            break
+
+        counts: Counter = Counter(
+            (link_id, created_at.replace(minute=0, second=0, microsecond=0), host)
+            for link_id, created_at, host in events
+        )
+        link_ids = {key[0] for key in counts}
+        existing = set(db.session.scalars(select(ShortLink.id).where(ShortLink.id.in_(link_ids))))
+        rows = [
+            {"short_link_id": link_id, "hour": hour, "referrer_host": host, "clicks": n}
+            for (link_id, hour, host), n in counts.items()
+            if link_id in existing
+        ]
+        if rows:
+            stmt = insert(hourly)
+            db.session.connection().execute(
+                stmt.on_conflict_do_update(
+                    index_elements=[hourly.c.short_link_id, hourly.c.hour, hourly.c.referrer_host],
+                    set_={"clicks": hourly.c.clicks + stmt.excluded.clicks},
+                ),
+                rows,
+            )
+        db.session.commit()
+        total += len(events)
+        if len(events) < batch_size:
+            break
+
+    if total:
+        current_app.logger.debug(f"Свернуто событий переходов: {total}")
+    return total
+
+
+def get_click_stats(link_ids: Iterable[int], hours: int = 24, top_referrers: int = 3) -> Dict[int, dict]:
+    """Переходы ссылок за последние hours часов по почасовым агрегатам.
+
+    Один запрос к short_link_click_hourly по первичному ключу (ссылка, час);
+    сырые события не читаются, поэтому недавние переходы появляются после
+    очередной свертки (SHORTLINK_ROLLUP_INTERVAL).
+
+    Returns:
+        Dict[int, dict]: link_id -> {"clicks": всего, "hourly": [клики по часам,
+        от старого к текущему], "referrers": [(host, clicks), ...]}
+    """
+    link_ids = list(link_ids)
+    if not link_ids:
+        return {}
+    since = datetime.utcnow().replace(minute=0, second=0, microsecond=0) - timedelta(hours=hours - 1)
+    rows = db.session.execute(
+        select(
+            ShortLinkClickHourly.short_link_id,
+            ShortLinkClickHourly.hour,
+            ShortLinkClickHourly.referrer_host,
+            ShortLinkClickHourly.clicks,
+        )
+        .where(ShortLinkClickHourly.short_link_id.in_(link_ids), ShortLinkClickHourly.hour >= since)
+    ).all()
+
+    stats: Dict[int, dict] = {}
+    referrers: Dict[int, Counter] = {}
+    for link_id, hour, host, clicks in rows:
+        entry = stats.setdefault(link_id, {"clicks": 0, "hourly": [0] * hours, "referrers": []})
+        entry["clicks"] += clicks
+        index = int((hour - since).total_seconds() // 3600)
+        if index < hours:  # час из будущего при расхождении часов воркеров
+            entry["hourly"][index] += clicks
+        referrers.setdefault(link_id, Counter())[host or "прямые"] += clicks
+    for link_id, counter in referrers.items():
+        stats[link_id]["referrers"] = counter.most_common(top_referrers)
+    return stats
+
+
+def delete_click_stats(link_id: int) -> None:
+    """Удаляет агрегаты и несвернутые события ссылки (без коммита)."""
+    db.session.execute(delete(ShortLinkClickHourly).where(ShortLinkClickHourly.short_link_id == link_id))
+    db.session.execute(delete(ShortLinkClick).where(ShortLinkClick.short_link_id == link_id))
@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import threading
+from datetime import datetime
+from typing import Dict, List, Tuple
+from urllib.parse import urlsplit
+
+from flask import current_app
+from sqlalchemy import bindparam, insert, update
+
+from .. import db
+from ..models import ShortLink, ShortLinkClick
+from ..utils.background import get_periodic_task
+
+
+# link_id -> клики, еще не записанные в БД (у каждого воркера свой буфер)
+_pending: Dict[int, int] = {}
+_pending_total = 0
+# События переходов (link_id, время, источник) для аналитики, ждущие записи
+_events: List[Tuple[int, datetime, str]] = []
+_lock = threading.Lock()
+
+
+def referrer_host(referrer: str) -> str:
+    """Хост из заголовка Referer ('' для прямых переходов и мусора)."""
+    try:
+        host = urlsplit(referrer or "").hostname or ""
+    except ValueError:
+        return ""
+    return host[:255]
+
+
+def record_click(link_id: int, referrer: str = "") -> None:
+    """Засчитывает переход в буфере процесса без записи в БД.
+
+    Буфер сбрасывается фоновой задачей раз в SHORTLINK_CLICK_FLUSH_INTERVAL
+    секунд или сразу, когда накопится SHORTLINK_CLICK_FLUSH_THRESHOLD кликов.
+    """
+    global _pending_total
+    with _lock:
+        _pending[link_id] = _pending.get(link_id, 0) + 1
+        _pending_total += 1
+    record_event(link_id, referrer)
+
+
+def record_event(link_id: int, referrer: str = "") -> None:
+    """Добавляет событие перехода в буфер аналитики (счетчик clicks не меняется).
+
+    Используется напрямую для ссылок с лимитом: их счетчик уже увеличен
+    условным UPDATE в claim_click.
+    """
+    event = (link_id, datetime.utcnow(), referrer_host(referrer))
+    with _lock:
+        _events.append(event)
+        full = max(_pending_total, len(_events)) >= current_app.config.get("SHORTLINK_CLICK_FLUSH_THRESHOLD", 1000)
+    if full:
+        _wake_flusher()
+
+
+def flush_clicks() -> int:
+    """Записывает накопленные клики и события переходов одной транзакцией.
+
+    Счетчики - один executemany UPDATE clicks = clicks + n на ссылку,
+    события - один executemany INSERT в short_link_click. При ошибке все
+    возвращается в буфер. Возвращает количество записанных кликов.
+    """
+    global _pending, _pending_total, _events
+    with _lock:
+        if not _pending and not _events:
+            return 0
+        batch, _pending, _pending_total = _pending, {}, 0
+        events, _events = _events, []
+
+    table = ShortLink.__table__
+    stmt = (
+        update(table)
+        .where(table.c.id == bindparam("link_id"))
+        .values(clicks=table.c.clicks + bindparam("n"))
+    )
+    try:
+        connection = db.session.connection()
+        if batch:
+            connection.execute(stmt, [{"link_id": link_id, "n": n} for link_id, n in batch.items()])
+        if events:
+            connection.execute(
+                insert(ShortLinkClick.__table__),
+                [
+                    {"short_link_id": link_id, "created_at": created_at, "referrer_host": host}
+                    for link_id, created_at, host in events
+                ],
+            )
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        with _lock:
+            for link_id, n in batch.items():
+                _pending[link_id] = _pending.get(link_id, 0) + n
+                _pending_total += n
+            _events[:0] = events
+        raise
+
+    flushed = sum(batch.values())
+    current_app.logger.debug(
+        f"Записано кликов коротких ссылок: {flushed} ({len(batch)} ссылок), событий: {len(events)}"
+    )
+    return flushed
+
+
+def discard_clicks(link_id: int) -> None:
+    """Забывает незаписанные клики и события ссылки (после сброса счетчика или удаления)."""
+    global _pending_total, _events
+    with _lock:
+        _pending_total -= _pending.pop(link_id, 0)
+        _events = [event for event in _events if event[0] != link_id]
+
+
+def _wake_flusher() -> None:
+    """Будит фоновую задачу, а без фоновых задач пишет клики сразу."""
+    task = get_periodic_task(current_app, "shortlink-clicks")
+    if task and task.is_running:
+        task.trigger()
+    else:
+        flush_clicks()
@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import threading
+from typing import Iterable, List, Optional, Set, Tuple
+
+from flask import current_app
+from sqlalchemy import func, select
+
+from .. import db
+from ..models import ShortLink
+from ..utils.bloom import BloomFilter
+
+
+# Минимальная емкость фильтра: запас под новые ссылки без перестроения
+_MIN_CAPACITY = 100_000
+_ERROR_RATE = 0.001
+
+
+class _CodeFilterState:
+    """Фильтр кодов процесса и максимальный id ссылки, до которого загружены все коды."""
+
+    def __init__(self) -> None:
+        self.bloom: Optional[BloomFilter] = None
+        self.max_id = 0
+        self.local_ids: Set[int] = set()  # id ссылок этого процесса больше max_id
+        self.stale = False  # Ссылки удалялись: фильтр нужно перестроить
+        self.rebuilding: Optional[List[Tuple[int, str]]] = None  # Коды, добавленные во время перестроения
+        self.lock = threading.Lock()
+        self.build_lock = threading.Lock()  # Перестроения идут по одному
+
+
+_state = _CodeFilterState()
+
+
+def might_exist(code: str) -> bool:
+    """Может ли существовать ссылка с таким кодом (False - точно нет).
+
+    Проверка идет только по фильтру в памяти процесса, без запросов к БД.
+    Коды ссылок этого процесса добавляет add_codes, коды других воркеров
+    и скриптов догружает фоновая задача refresh_code_filter, поэтому ссылка
+    другого воркера может получить 404 не дольше
+    SHORTLINK_CODE_FILTER_REFRESH секунд после создания.
+    """
+    if not current_app.config.get("SHORTLINK_CODE_FILTER", True):
+        return True
+    _ensure_built()
+    return code in _state.bloom
+
+
+def add_codes(links: Iterable[Tuple[int, str]]) -> None:
+    """Добавляет в фильтр коды ссылок (id, code), созданных этим процессом."""
+    with _state.lock:
+        if _state.bloom is None and _state.rebuilding is None:
+            return
+        for link_id, code in links:
+            if _state.bloom is not None:
+                _state.bloom.add(code)
+            if _state.rebuilding is not None:
+                _state.rebuilding.append((link_id, code))
+            if link_id > _state.max_id:
+                _state.local_ids.add(link_id)
+        _advance()
+
+
+def _advance() -> None:
+    # Курсор сдвигается только по подряд идущим id: ссылки других воркеров
+    # с меньшими id еще не загружены и должны остаться за курсором
+    while _state.max_id + 1 in _state.local_ids:
+        _state.max_id += 1
+        _state.local_ids.discard(_state.max_id)
+
+
+def mark_code_filter_stale() -> None:
+    """Помечает фильтр для перестроения (ссылки удалялись или архивировались).
+
+    SQLite выдает удаленный последний id повторно, и новая ссылка с ним
+    оказалась бы за курсором догрузки.
+    """
+    _state.stale = True
+
+
+def refresh_code_filter() -> None:
+    """Фоновая задача: догружает в фильтр ссылки с id больше последнего загруженного."""
+    if not current_app.config.get("SHORTLINK_CODE_FILTER", True):
+        return
+    if _state.bloom is None:
+        _ensure_built()
+        return
+    if _state.stale or _state.bloom.count > _state.bloom.capacity:
+        # Удалялись ссылки или точность упала ниже расчетной
+        rebuild_code_filter()
+        return
+    latest_id = db.session.scalar(select(func.max(ShortLink.id))) or 0
+    if latest_id <= _state.max_id:
+        return
+    with _state.lock:
+        rows = db.session.execute(
+            select(ShortLink.id, ShortLink.code).where(ShortLink.id > _state.max_id).order_by(ShortLink.id)
+        ).all()
+        for link_id, code in rows:
+            if link_id not in _state.local_ids:
+                _state.bloom.add(code)
+            _state.max_id = link_id
+        _state.local_ids = {link_id for link_id in _state.local_ids if link_id > _state.max_id}
+
+
+def rebuild_code_filter() -> int:
+    """Строит фильтр заново по всем кодам из БД; возвращает их количество.
+
+    Чтение идет без блокировки фильтра: коды, добавленные add_codes за это
+    время, переносятся в новый фильтр при замене.
+    """
+    with _state.build_lock:
+        return _rebuild()
+
+
+def _ensure_built() -> None:
+    # Фильтр строится при первом обращении в процессе (запросом или фоновой задачей)
+    if _state.bloom is None:
+        with _state.build_lock:
+            if _state.bloom is None:
+                _rebuild()
+
+
+def _rebuild() -> int:
+    with _state.lock:
+        _state.stale = False
+        _state.rebuilding = []
+    try:
+        total = db.session.scalar(select(func.count(ShortLink.id))) or 0
+        bloom = BloomFilter(max(_MIN_CAPACITY, total * 2), _ERROR_RATE)
+        max_id = 0
+        for link_id, code in db.session.execute(select(ShortLink.id, ShortLink.code)):
+            bloom.add(code)
+            max_id = max(max_id, link_id)
+    except Exception:
+        with _state.lock:
+            _state.rebuilding = None
+        raise
+    with _state.lock:
+        for _, code in _state.rebuilding:
+            bloom.add(code)
+        _state.rebuilding = None
+        _state.bloom, _state.max_id = bloom, max_id
+        _state.local_ids = {link_id for link_id in _state.local_ids if link_id > max_id}
+        _advance()
+    current_app.logger.info(f"Фильтр кодов коротких ссылок построен: {total} кодов")
+    return total
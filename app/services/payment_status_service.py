@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from flask import current_app
+
+from .. import db
+from ..models import Payment
+from ..utils.cache import TTLCache
+from .subscription_service import invalidate_subscription_status
+
+
+# yookassa_payment_id -> словарь статуса для страниц и API
+_status_cache = TTLCache(maxsize=2048, ttl=5)
+
+
+class _ReconcileCursor:
+    """Место, где остановился обход старых pending-платежей (created_at)."""
+
+    before: Optional[datetime] = None
+
+
+_reconcile_cursor = _ReconcileCursor()
+
+
+def get_payment_status_cached(payment_id: str, refresh_pending: bool = False) -> Dict[str, Any]:
+    """Возвращает сохраненный в БД статус платежа через короткий TTL-кеш.
+
+    Статусы обновляют webhook'и и фоновая сверка, поэтому опрос страницы
+    статуса не ходит в ЮKassa. С refresh_pending=True платеж, который все
+    еще pending, один раз сверяется с ЮKassa (например, при возврате
+    пользователя с платежной страницы).
+    """
+    cached = _status_cache.get(payment_id)
+    if cached is not None and not (refresh_pending and cached["status"] == "pending"):
+        return cached
+
+    payment_record = Payment.query.filter_by(yookassa_payment_id=payment_id).first()
+    if not payment_record:
+        return {"error": "Платеж не найден"}
+
+    if refresh_pending and payment_record.status == "pending":
+        reconcile_payments([payment_record])
+
+    status = _serialize_payment(payment_record)
+    _status_cache.set(payment_id, status, ttl=current_app.config.get("PAYMENT_STATUS_CACHE_TTL"))
+    return status
+
+
+def invalidate_payment_status(payment_id: str) -> None:
+    """Сбрасывает закешированный статус платежа."""
+    _status_cache.delete(payment_id)
+
+
+def reconcile_payments(payment_records: List[Payment]) -> int:
+    """Сверяет платежи с ЮKassa и сохраняет изменения одной транзакцией.
+
+    Запросы к API выполняются параллельно (не более
+    PAYMENT_RECONCILE_CONCURRENCY одновременно). Возвращает количество
+    платежей, у которых изменился статус.
+    """
+    from ..utils.payment_service import get_payment_service
+
+    if not payment_records:
+        return 0
+
+    payment_service = get_payment_service()
+    concurrency = current_app.config.get("PAYMENT_RECONCILE_CONCURRENCY", 4)
+    payment_ids = [p.yookassa_payment_id for p in payment_records]
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(payment_ids))) as pool:
+        responses = list(pool.map(payment_service.fetch_payment, payment_ids))
+
+    changed = []
+    touched_users = set()
+    for payment_record, response in zip(payment_records, responses):
+        if "error" in response:
+            continue
+        status = response.get("status", "pending")
+        if status == payment_record.status:
+            continue
+        user = payment_service.apply_payment_status(
+            payment_record, status, paid=response.get("paid", False)
+        )
+        changed.append(payment_record.yookassa_payment_id)
+        if user:
+            touched_users.add(user.id)
+
+    if not changed:
+        return 0
+
+    db.session.commit()
+    for payment_id in changed:
+        invalidate_payment_status(payment_id)
+    for user_id in touched_users:
+        invalidate_subscription_status(user_id)
+    current_app.logger.info(f"Сверка платежей: обновлено {len(changed)} из {len(payment_records)}")
+    return len(changed)
+
+
+def reconcile_pending_payments() -> int:
+    """Фоновая сверка недавних платежей в статусе pending.
+
+    Половина пачки - самые новые платежи: их оплату пользователь ждет прямо
+    сейчас, и брошенные старые платежи не должны их вытеснять. Вторая
+    половина обходит более старые pending-платежи по кругу, продолжая с
+    места, где остановилась прошлая сверка.
+    """
+    from ..utils.payment_service import get_payment_service
+
+    if get_payment_service().simulation_mode:
+        return 0
+
+    batch_size = current_app.config.get("PAYMENT_RECONCILE_BATCH_SIZE", 200)
+    max_age = timedelta(hours=current_app.config.get("PAYMENT_RECONCILE_MAX_AGE_HOURS", 24))
+    recent = Payment.query.filter(
+        Payment.status == "pending",
+        Payment.created_at >= datetime.utcnow() - max_age,
+    ).order_by(Payment.created_at.desc())
+
+    newest_count = batch_size - batch_size // 2
+    pending = recent.limit(newest_count).all()
+    if len(pending) == newest_count and batch_size // 2:
+        boundary = pending[-1].created_at
+        before = _reconcile_cursor.before
+        if before is None or before > boundary:
+            before = boundary
+        older = recent.filter(Payment.created_at < before).limit(batch_size // 2).all()
+        if not older and before < boundary:
+            older = recent.filter(Payment.created_at < boundary).limit(batch_size // 2).all()
+        # Дошли до конца окна - следующая сверка начнет обход заново
+        _reconcile_cursor.before = older[-1].created_at if len(older) == batch_size // 2 else None
+        pending.extend(older)
+    return reconcile_payments(pending)
+
+
+def _serialize_payment(payment_record: Payment) -> Dict[str, Any]:
+    """Формирует ответ о статусе в формате YooKassaService.get_payment_status."""
+    return {
+        "payment_id": payment_record.yookassa_payment_id,
+        "status": payment_record.status,
+        "amount": str(payment_record.amount),
+        "currency": payment_record.currency or "RUB",
+        "description": payment_record.description
+        or "Подписка на образовательную платформу",
+        "created_at": payment_record.created_at.isoformat()
+        if payment_record.created_at
+        else None,
+        "paid": payment_record.status == "succeeded",
+    }
@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from flask import current_app
+from sqlalchemy import delete, func, insert, select
+
+from .. import db
+from ..models import ShortLink, ShortLinkArchive, ShortLinkClick, ShortLinkClickHourly, ShortLinkRule
+from .click_counter import discard_clicks
+from .shortlink_service import invalidate_short_link, mark_short_links_changed
+
+
+def _dead_link_ids(now: datetime, limit: int) -> List[int]:
+    """id ссылок, истекших больше SHORTLINK_ARCHIVE_GRACE_HOURS назад или исчерпавших лимит кликов."""
+    grace = timedelta(hours=current_app.config.get("SHORTLINK_ARCHIVE_GRACE_HOURS", 24))
+    expired = db.session.scalars(
+        select(ShortLinkRule.short_link_id).where(ShortLinkRule.expires_at < now - grace).limit(limit)
+    ).all()
+    if len(expired) >= limit:
+        return list(expired)
+    exhausted = db.session.scalars(
+        select(ShortLinkRule.short_link_id)
+        .join(ShortLink, ShortLink.id == ShortLinkRule.short_link_id)
+        .where(ShortLinkRule.max_clicks.is_not(None), ShortLink.clicks >= ShortLinkRule.max_clicks)
+        .limit(limit - len(expired))
+    ).all()
+    return list(dict.fromkeys([*expired, *exhausted]))
+
+
+def sweep_dead_links(chunk_size: int = 500) -> int:
+    """Переносит истекшие и исчерпанные ссылки в short_link_archive.
+
+    Ссылки обрабатываются пачками по chunk_size, каждая пачка - одна
+    транзакция. Первым выражением правила пачки удаляются через DELETE ...
+    RETURNING: оно берет блокировку записи и возвращает только еще не
+    перенесенные ссылки, поэтому параллельный перенос из другого воркера не
+    создаст дублей в архиве. Затем ссылки копируются в архив одним INSERT и
+    удаляются вместе с агрегатами переходов. Коды таких ссылок после
+    карантина (SHORTLINK_CODE_QUARANTINE_DAYS) снова выдаются новым ссылкам.
+    Возвращает количество перенесенных ссылок.
+    """
+    total = 0
+    while True:
+        now = datetime.utcnow()
+        ids = _dead_link_ids(now, chunk_size)
+        if not ids:
+            db.session.commit()
+            break
+
+        rules = {
+            row.short_link_id: row
+            for row in db.session.execute(
+                delete(ShortLinkRule)
+                .where(ShortLinkRule.short_link_id.in_(ids))
+                .returning(ShortLinkRule.short_link_id, ShortLinkRule.expires_at, ShortLinkRule.max_clicks)
+                .execution_options(synchronize_session=False)
+            )
+        }
+        rows = db.session.execute(
+            select(ShortLink.id, ShortLink.code, ShortLink.original_url, ShortLink.clicks, ShortLink.created_at)
+            .where(ShortLink.id.in_(list(rules)))
+        ).all() if rules else []
+        archived: List[Dict] = []
+        for row in rows:
+            rule = rules[row.id]
+            archived.append({
+                "link_id": row.id,
+                "code": row.code,
+                "original_url": row.original_url,
+                "clicks": row.clicks,
+                "created_at": row.created_at,
+                "expires_at": rule.expires_at,
+                "max_clicks": rule.max_clicks,
+                "reason": "expired_time" if rule.expires_at and rule.expires_at < now else "expired_clicks",
+                "archived_at": now,
+            })
+        if archived:
+            db.session.execute(insert(ShortLinkArchive), archived)
+            moved = [row.id for row in rows]
+            for model, column in (
+                (ShortLinkClickHourly, ShortLinkClickHourly.short_link_id),
+                (ShortLinkClick, ShortLinkClick.short_link_id),
+                (ShortLink, ShortLink.id),
+            ):
+                db.session.execute(
+                    delete(model).where(column.in_(moved)).execution_options(synchronize_session=False)
+                )
+            mark_short_links_changed()
+        db.session.commit()
+
+        for row in rows:
+            discard_clicks(row.id)
+            invalidate_short_link(row.code)
+        total += len(archived)
+        if len(ids) < chunk_size:
+            break
+
+    if total:
+        current_app.logger.info(f"Перенесено в архив коротких ссылок: {total}")
+    return total
+
+
+def get_archive_stats() -> Dict[str, int]:
+    """Количество ссылок в архиве и кодов, ожидающих переиспользования."""
+    total = db.session.scalar(select(func.count(ShortLinkArchive.id))) or 0
+    pending = db.session.scalar(
+        select(func.count(ShortLinkArchive.id)).where(ShortLinkArchive.code_reused_at.is_(None))
+    ) or 0
+    return {"total": total, "codes_pending": pending}
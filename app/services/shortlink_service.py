@@ -1,11 +1,60 @@
 from __future__ import annotations
 
 from datetime import datetime, timedelta
-from typing import Optional, Tuple
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+import csv
+import io
+import json
 import re
 
+from flask import current_app
+from sqlalchemy import and_, bindparam, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import contains_eager
+
 from .. import db
-from ..models import ShortLink, ShortLinkRule
+from ..models import CodeSequence, ShortLink, ShortLinkRule
+from ..utils.cache import TTLCache
+from ..utils.pagination import keyset_page, prefix_filter
+from .click_analytics import delete_click_stats
+from .click_counter import discard_clicks, record_click, record_event
+from .code_filter import add_codes, mark_code_filter_stale, might_exist
+
+
+class CachedShortLink(NamedTuple):
+    """Данные ссылки и ее правила, достаточные для редиректа."""
+
+    id: int
+    url: str
+    expires_at: Optional[datetime]
+    max_clicks: Optional[int]
+
+
+# code -> CachedShortLink. Кеш процесса; изменения ссылок из других процессов
+# (админка, архивация, скрипты) увеличивают версию кеша в БД, а фоновая задача
+# каждого процесса (sync_short_link_cache) сбрасывает кеш, увидев новую версию.
+_resolve_cache = TTLCache(maxsize=10000, ttl=60)
+
+# Имя счетчика версии кеша в таблице CodeSequence
+SHORTLINK_CACHE_VERSION = "shortlink-cache-version"
+
+
+class _CacheVersion:
+    """Версия кеша ссылок, с которой согласован _resolve_cache процесса.
+
+    generation растет при каждом сбросе кеша: запись, прочитанная из БД до
+    сброса, в кеш уже не попадает.
+    """
+
+    value: Optional[int] = None
+    generation = 0
+
+
+_cache_version = _CacheVersion()
+
+
+# Фильтры списка коротких ссылок в админке
+SHORTLINK_FILTERS = ("active", "expired", "limited")
 
 
 def normalize_url(raw_url: str) -> str:
@@ -32,22 +81,198 @@ def parse_max_clicks(value: str) -> Optional[int]:
     return int(value) if value.isdigit() else None
 
 
-def create_short_link(original_url: str, ttl: str = "", max_clicks: str = "") -> ShortLink:
-    """Создает короткую ссылку и при необходимости правило ограничения."""
-    normalized = normalize_url(original_url)
-    link = ShortLink.create_unique(normalized)
-
+def _build_rule(ttl: str, max_clicks: str) -> Optional[ShortLinkRule]:
+    """Правило ограничения из параметров формы или None, если ограничений нет."""
     expires_at = parse_ttl(ttl)
     limit_clicks = parse_max_clicks(max_clicks)
-
     if expires_at or limit_clicks is not None:
-        rule = ShortLinkRule(short_link_id=link.id, expires_at=expires_at, max_clicks=limit_clicks)
-        db.session.add(rule)
-        db.session.commit()
+        return ShortLinkRule(expires_at=expires_at, max_clicks=limit_clicks)
+    return None
+
+
+def find_reusable_links(urls: Iterable[str]) -> Dict[str, ShortLink]:
+    """Существующие ссылки без правил для нормализованных URL (поиск по индексу url_hash)."""
+    hashes = {ShortLink.hash_url(url) for url in urls}
+    if not hashes:
+        return {}
+    stmt = (
+        select(ShortLink)
+        .outerjoin(ShortLinkRule, ShortLinkRule.short_link_id == ShortLink.id)
+        .where(ShortLink.url_hash.in_(hashes), ShortLinkRule.id.is_(None))
+        .order_by(ShortLink.id)
+    )
+    found: Dict[str, ShortLink] = {}
+    for link in db.session.scalars(stmt):
+        # Сравнение URL защищает от коллизии хеша
+        found.setdefault(link.original_url, link)
+    return found
+
 
+def create_short_link(
+    original_url: str, ttl: str = "", max_clicks: str = "", dedup: Optional[bool] = None
+) -> ShortLink:
+    """Создает короткую ссылку и при необходимости правило ограничения одной транзакцией.
+
+    В режиме дедупликации (SHORTLINK_DEDUP или dedup=True) ссылка без
+    ограничений на уже сокращенный URL не создается: возвращается
+    существующая ссылка без правил.
+    """
+    normalized = normalize_url(original_url)
+    rule = _build_rule(ttl, max_clicks)
+    if dedup is None:
+        dedup = current_app.config.get("SHORTLINK_DEDUP", False)
+    if dedup and rule is None:
+        existing = find_reusable_links([normalized]).get(normalized)
+        if existing is not None:
+            return existing
+
+    link = ShortLink.allocate(normalized)
+    link.rule = rule
+    created = (link.id, link.code)
+    db.session.commit()
+    add_codes([created])
     return link
 
 
+def read_csv_rows(lines: Iterable[str]) -> Iterator[Dict[str, str]]:
+    """Разбирает CSV со столбцами url[,ttl[,max_clicks]]; строка заголовка необязательна."""
+    for index, row in enumerate(csv.reader(lines)):
+        if not row or not row[0].strip():
+            continue
+        if index == 0 and row[0].strip().lower() == "url":
+            continue
+        yield {
+            "url": row[0],
+            "ttl": row[1] if len(row) > 1 else "",
+            "max_clicks": row[2] if len(row) > 2 else "",
+        }
+
+
+def bulk_create_short_links(
+    rows: Iterable[Dict[str, str]],
+    batch_size: int = 500,
+    default_ttl: str = "",
+    default_max_clicks: str = "",
+) -> Iterator[Dict[str, Any]]:
+    """Создает ссылки пачками и отдает результат по мере коммита каждой пачки.
+
+    На пачку - одно резервирование номеров кодов (CodeSequence.next_value
+    с count), одна вставка ссылок и правил и один коммит. Порядок результатов
+    совпадает с порядком строк; пустые URL возвращаются с ошибкой. В режиме
+    SHORTLINK_DEDUP строки без ограничений получают существующие ссылки
+    (reused=True), найденные одним запросом на пачку.
+    """
+    batch: List[Dict[str, str]] = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield from _create_batch(batch, default_ttl, default_max_clicks)
+            batch = []
+    if batch:
+        yield from _create_batch(batch, default_ttl, default_max_clicks)
+
+
+def _create_batch(rows: List[Dict[str, str]], default_ttl: str, default_max_clicks: str) -> List[Dict[str, Any]]:
+    prepared: List[Tuple[str, Optional[ShortLinkRule]]] = []
+    for row in rows:
+        url = (row.get("url") or "").strip()
+        ttl = (row.get("ttl") or default_ttl or "").strip()
+        max_clicks = (str(row.get("max_clicks") or "") or default_max_clicks or "").strip()
+        prepared.append((normalize_url(url) if url else "", _build_rule(ttl, max_clicks)))
+
+    dedup = current_app.config.get("SHORTLINK_DEDUP", False)
+    reusable = find_reusable_links(url for url, rule in prepared if url and rule is None) if dedup else {}
+
+    # Повторы URL без правил внутри пачки тоже получают одну ссылку
+    links: List[Optional[ShortLink]] = []
+    new_links: List[ShortLink] = []
+    for url, rule in prepared:
+        link = reusable.get(url) if url and rule is None else None
+        if url and link is None:
+            link = ShortLink(original_url=url)
+            new_links.append(link)
+            if dedup and rule is None:
+                reusable[url] = link
+        links.append(link)
+
+    ShortLink.add_with_codes(new_links)
+    # Новая ссылка считается созданной только для первой строки с ней
+    created = {id(link) for link in new_links}
+    results = []
+    for link, (url, rule) in zip(links, prepared):
+        if link is None:
+            results.append({"url": url, "code": None, "expires_at": None, "max_clicks": None,
+                            "reused": False, "error": "empty url"})
+            continue
+        if rule is not None:
+            link.rule = rule
+        results.append({
+            "url": url,
+            "code": link.code,
+            "expires_at": rule.expires_at.isoformat() if rule and rule.expires_at else None,
+            "max_clicks": rule.max_clicks if rule else None,
+            "reused": id(link) not in created,
+            "error": None,
+        })
+        created.discard(id(link))
+    if new_links:
+        codes = [(link.id, link.code) for link in new_links]
+        db.session.commit()
+        add_codes(codes)
+    return results
+
+
+BULK_RESULT_FIELDS = ("url", "code", "short_url", "expires_at", "max_clicks", "reused", "error")
+
+
+def bulk_results_csv(results: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    """Результаты bulk_create_short_links построчно в CSV (с заголовком)."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=BULK_RESULT_FIELDS, extrasaction="ignore", lineterminator="\n")
+    writer.writeheader()
+    for result in results:
+        writer.writerow(result)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def bulk_results_json(results: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    """Результаты bulk_create_short_links потоком одного JSON-массива."""
+    yield "["
+    for index, result in enumerate(results):
+        yield ("," if index else "") + json.dumps(
+            {field: result.get(field) for field in BULK_RESULT_FIELDS}, ensure_ascii=False
+        )
+    yield "]\n"
+
+
+def backfill_url_hashes(batch_size: int = 1000) -> int:
+    """Заполняет url_hash у ссылок, созданных до появления столбца.
+
+    Обрабатывает строки пачками (executemany + коммит на пачку), пока
+    не останется ссылок без хеша. Возвращает количество обновленных строк.
+    """
+    table = ShortLink.__table__
+    stmt = update(table).where(table.c.id == bindparam("link_id")).values(url_hash=bindparam("h"))
+    total = 0
+    while True:
+        rows = db.session.execute(
+            select(table.c.id, table.c.original_url).where(table.c.url_hash.is_(None)).limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        db.session.connection().execute(
+            stmt, [{"link_id": link_id, "h": ShortLink.hash_url(url)} for link_id, url in rows]
+        )
+        db.session.commit()
+        total += len(rows)
+    if total:
+        current_app.logger.info(f"Заполнен url_hash у коротких ссылок: {total}")
+    return total
+
+
 def update_rule(link: ShortLink, ttl: str = "", max_clicks: str = "") -> None:
     """Обновляет/создает правило ограничения для короткой ссылки."""
     expires_at = parse_ttl(ttl)
@@ -59,37 +284,208 @@ def update_rule(link: ShortLink, ttl: str = "", max_clicks: str = "") -> None:
     else:
         link.rule.expires_at = expires_at
         link.rule.max_clicks = limit_clicks
+    # Кеши других процессов сбрасываются сразу: иначе ссылка без лимита в их
+    # кеше продолжала бы засчитываться в буфер мимо claim_click
+    mark_short_links_changed()
     db.session.commit()
-
-
-def check_access(link: ShortLink) -> Tuple[bool, Optional[str]]:
-    """Проверяет, можно ли перейти по ссылке.
-
-    Возвращает (allowed, reason), где reason: 'expired_time' | 'expired_clicks' | None
-    """
-    if link.rule:
-        if link.rule.expires_at and datetime.utcnow() > link.rule.expires_at:
-            return False, "expired_time"
-        if link.rule.max_clicks is not None and link.clicks >= link.rule.max_clicks:
-            return False, "expired_clicks"
-    return True, None
-
-
-def register_click(link: ShortLink) -> None:
-    """Увеличивает счётчик кликов и сохраняет в БД."""
-    link.clicks += 1
-    db.session.commit()
+    invalidate_short_link(link.code)
 
 
 def reset_clicks(link: ShortLink) -> None:
-    """Сбрасывает счётчик кликов ссылки."""
+    """Сбрасывает счётчик кликов и статистику переходов ссылки."""
     link.clicks = 0
+    delete_click_stats(link.id)
+    mark_short_links_changed()
     db.session.commit()
+    discard_clicks(link.id)
+    invalidate_short_link(link.code)
 
 
 def delete_short_link(link: ShortLink) -> None:
     """Удаляет короткую ссылку и связанные объекты."""
+    code, link_id = link.code, link.id
+    delete_click_stats(link_id)
     db.session.delete(link)
+    mark_short_links_changed()
     db.session.commit()
+    discard_clicks(link_id)
+    invalidate_short_link(code)
+
+
+def get_cached_link(code: str) -> Optional[CachedShortLink]:
+    """Возвращает ссылку с правилом из кеша, при промахе - одним запросом (LEFT JOIN).
+
+    Попадание в кеш не обращается к БД: версию кеша сверяет фоновая задача
+    sync_short_link_cache. Коды, которых точно нет по фильтру кодов
+    (code_filter), тоже отклоняются без запросов к БД.
+    """
+    cached = _resolve_cache.get(code)
+    if cached is None:
+        if not might_exist(code):
+            return None
+        generation = _cache_version.generation
+        row = (
+            db.session.query(
+                ShortLink.id, ShortLink.original_url, ShortLinkRule.expires_at, ShortLinkRule.max_clicks
+            )
+            .outerjoin(ShortLinkRule)
+            .filter(ShortLink.code == code)
+            .first()
+        )
+        if row is None:
+            return None
+        cached = CachedShortLink(*row)
+        if generation == _cache_version.generation:
+            _resolve_cache.set(code, cached, ttl=current_app.config.get("SHORTLINK_CACHE_TTL"))
+    return cached
+
+
+def resolve_short_link(code: str, referrer: str = "") -> Tuple[Optional[str], Optional[str]]:
+    """Проверяет правила ссылки и засчитывает переход.
+
+    Поиск ссылки и срок действия проверяются по кешу. Клики ссылок без
+    лимита копятся в буфере процесса (click_counter) и пишутся пачками.
+    Ссылки с лимитом засчитываются сразу одним условным UPDATE (claim_click),
+    поэтому лимит не превышается даже при параллельных переходах из разных воркеров.
+    Лимит, добавленный в другом процессе, начинает действовать здесь не позже
+    чем через SHORTLINK_CACHE_SYNC_INTERVAL: update_rule увеличивает версию
+    кеша, и sync_short_link_cache сбрасывает кеш.
+    Каждый засчитанный переход также попадает в буфер событий для аналитики
+    (источник - хост из referrer).
+
+    Возвращает (url, reason), где reason: 'not_found' | 'expired_time' | 'expired_clicks' | None
+    """
+    link = get_cached_link(code)
+    if link is None:
+        return None, "not_found"
+    if link.expires_at and datetime.utcnow() > link.expires_at:
+        return None, "expired_time"
+
+    if link.max_clicks is None:
+        record_click(link.id, referrer)
+        return link.url, None
+
+    url = claim_click(code)
+    if url is not None:
+        record_event(link.id, referrer)
+        return url, None
+
+    # Правило могли изменить или удалить в другом воркере: перечитываем ссылку
+    invalidate_short_link(code)
+    link = get_cached_link(code)
+    if link is None:
+        return None, "not_found"
+    if link.expires_at and datetime.utcnow() > link.expires_at:
+        return None, "expired_time"
+    if link.max_clicks is None:
+        record_click(link.id, referrer)
+        return link.url, None
+    url = claim_click(code)
+    if url is None:
+        return None, "expired_clicks"
+    record_event(link.id, referrer)
+    return url, None
+
+
+def claim_click(code: str) -> Optional[str]:
+    """Засчитывает переход по ссылке с правилом одним условным UPDATE.
+
+    Проверка правила (срок и лимит кликов) и увеличение счетчика выполняются
+    в одном выражении UPDATE ... WHERE clicks < max_clicks AND (expires_at
+    IS NULL OR expires_at > now) RETURNING original_url, поэтому лимит точен
+    при любом числе параллельных переходов.
+
+    Возвращает URL, если переход разрешен, иначе None (нет ссылки, нет правила
+    или правило запрещает переход).
+    """
+    url = db.session.execute(claim_click_statement(code, datetime.utcnow())).scalar()
+    db.session.commit()
+    return url
+
+
+def claim_click_statement(code: str, now: datetime):
+    """UPDATE ... RETURNING original_url для claim_click."""
+    rule_allows = (
+        select(ShortLinkRule.id)
+        .where(
+            ShortLinkRule.short_link_id == ShortLink.id,
+            or_(ShortLinkRule.max_clicks.is_(None), ShortLink.clicks < ShortLinkRule.max_clicks),
+            or_(ShortLinkRule.expires_at.is_(None), ShortLinkRule.expires_at > now),
+        )
+        .exists()
+    )
+    return (
+        update(ShortLink)
+        .where(ShortLink.code == code, rule_allows)
+        .values(clicks=ShortLink.clicks + 1)
+        .returning(ShortLink.original_url)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def mark_short_links_changed() -> None:
+    """Увеличивает версию кеша ссылок в текущей транзакции (коммит - у вызывающего).
+
+    Вызывается при изменении, удалении или архивации ссылок: кеши редиректов
+    всех процессов сбрасываются при следующей проверке sync_short_link_cache.
+    """
+    CodeSequence.next_value(SHORTLINK_CACHE_VERSION)
+
+
+def sync_short_link_cache() -> None:
+    """Фоновая задача: сбрасывает кеш процесса, если версия в БД изменилась."""
+    version = db.session.scalar(
+        select(CodeSequence.value).where(CodeSequence.name == SHORTLINK_CACHE_VERSION)
+    ) or 0
+    if version != _cache_version.value:
+        if _cache_version.value is not None:
+            # Среди изменений могли быть удаления: фильтр кодов перестраивается
+            mark_code_filter_stale()
+        clear_short_link_cache()
+        _cache_version.value = version
+
+
+def invalidate_short_link(code: str) -> None:
+    """Удаляет ссылку из кеша редиректов."""
+    _resolve_cache.delete(code)
+
+
+def clear_short_link_cache() -> None:
+    """Полностью очищает кеш редиректов (после массовых изменений)."""
+    _cache_version.generation += 1
+    _resolve_cache.clear()
+
+
+def list_short_links(
+    prefix: str = "",
+    status_filter: str = "",
+    after_id: Optional[int] = None,
+    limit: int = 50,
+) -> Tuple[List[ShortLink], Optional[int]]:
+    """Страница коротких ссылок (новые первыми) с поиском по префиксу кода.
+
+    Правило подгружается тем же запросом (LEFT JOIN), чтобы шаблон не делал
+    отдельный SELECT на каждую строку.
+    """
+    query = ShortLink.query.outerjoin(ShortLinkRule).options(contains_eager(ShortLink.rule))
+    prefix = (prefix or "").strip()
+    if prefix:
+        query = query.filter(prefix_filter(ShortLink.code, prefix))
 
+    now = datetime.utcnow()
+    if status_filter == "expired":
+        query = query.filter(
+            or_(ShortLinkRule.expires_at < now, ShortLink.clicks >= ShortLinkRule.max_clicks)
+        )
+    elif status_filter == "active":
+        # Явные проверки на NULL: NOT (NULL OR FALSE) в SQL дает NULL, а не TRUE
+        query = query.filter(
+            and_(
+                or_(ShortLinkRule.expires_at.is_(None), ShortLinkRule.expires_at >= now),
+                or_(ShortLinkRule.max_clicks.is_(None), ShortLink.clicks < ShortLinkRule.max_clicks),
+            )
+        )
+    elif status_filter == "limited":
+        query = query.filter(ShortLinkRule.id.isnot(None))
 
+    return keyset_page(query, ShortLink.id, after=after_id, limit=limit, descending=True)
@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+from flask import current_app, g, has_request_context
+from sqlalchemy import exists, update
+
+from .. import db
+from ..models import Payment, User
+from ..utils.cache import TTLCache
+
+
+# user_id -> bool. Общий для всех запросов процесса, размер ограничен LRU.
+_status_cache = TTLCache(maxsize=4096, ttl=60)
+
+
+def get_subscription_status(user) -> bool:
+    """Возвращает статус подписки пользователя с кешированием.
+
+    Сначала смотрит в мемо текущего запроса (flask.g), затем в TTL-кеш процесса,
+    и только при промахе вызывает YooKassaService.check_user_subscription.
+    """
+    if not user or not user.is_authenticated:
+        return False
+
+    user_id = user.id
+    memo = _request_memo()
+    if memo is not None and user_id in memo:
+        return memo[user_id]
+
+    status = _status_cache.get(user_id)
+    if status is None:
+        from ..utils.payment_service import get_payment_service
+
+        status = get_payment_service().check_user_subscription(user)
+        _status_cache.set(user_id, status, ttl=current_app.config.get("SUBSCRIPTION_CACHE_TTL"))
+
+    if memo is not None:
+        memo[user_id] = status
+    return status
+
+
+def invalidate_subscription_status(user_id: int) -> None:
+    """Сбрасывает закешированный статус подписки пользователя."""
+    _status_cache.delete(user_id)
+    memo = _request_memo()
+    if memo is not None:
+        memo.pop(user_id, None)
+
+
+def clear_subscription_cache() -> None:
+    """Полностью очищает кеш статусов подписки (например, после массовых изменений)."""
+    _status_cache.clear()
+    memo = _request_memo()
+    if memo is not None:
+        memo.clear()
+
+
+def expire_subscriptions() -> int:
+    """Сбрасывает истекшие подписки и подписки без успешного платежа.
+
+    Выполняется фоновой задачей, поэтому чтения (check_user_subscription)
+    никогда не пишут в БД. Истекшие подписки сбрасываются одним UPDATE,
+    неоплаченные (не выданные вручную и без платежа со статусом succeeded) -
+    вторым. Возвращает количество затронутых пользователей.
+    """
+    expired = db.session.execute(
+        update(User)
+        .where(
+            User.is_subscribed.is_(True),
+            User.subscription_expires.isnot(None),
+            User.subscription_expires < datetime.utcnow(),
+        )
+        .values(is_subscribed=False, is_manual_subscription=False)
+        .execution_options(synchronize_session=False)
+    )
+    unpaid = db.session.execute(
+        update(User)
+        .where(
+            User.is_subscribed.is_(True),
+            User.is_manual_subscription.isnot(True),
+            ~exists().where(Payment.user_id == User.id, Payment.status == "succeeded"),
+        )
+        .values(is_subscribed=False)
+        .execution_options(synchronize_session=False)
+    )
+    rowcount = expired.rowcount + unpaid.rowcount
+    if rowcount:
+        # Массовый UPDATE минует события ORM: версия кеша пользователей
+        # увеличивается явно, и кеши сбрасываются во всех процессах
+        from .user_cache import clear_user_cache, mark_users_changed
+
+        mark_users_changed()
+    db.session.commit()
+
+    if rowcount:
+        clear_subscription_cache()
+        clear_user_cache()
+        current_app.logger.info(
+            f"Сброшено подписок: истекших {expired.rowcount}, без оплаты {unpaid.rowcount}"
+        )
+    return rowcount
+
+
+def _request_memo():
+    """Словарь статусов в рамках текущего запроса или None вне запроса."""
+    if not has_request_context():
+        return None
+    if "subscription_status" not in g:
+        g.subscription_status = {}
+    return g.subscription_status
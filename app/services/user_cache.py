@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+from typing import Any, Dict, Optional
+
+from flask import current_app
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from .. import db
+from ..models import CodeSequence, User
+from ..utils.cache import TTLCache
+
+
+# user_id -> снимок колонок пользователя (без связей и состояния сессии).
+# Кеш процесса; изменения пользователей увеличивают версию кеша в БД, а фоновая
+# задача каждого процесса (sync_user_cache) сбрасывает кеш, увидев новую версию.
+_user_cache = TTLCache(maxsize=1024, ttl=5)
+
+# Имя счетчика версии кеша пользователей в таблице CodeSequence
+USER_CACHE_VERSION = "user-cache-version"
+
+
+class _CacheVersion:
+    """Версия кеша пользователей, с которой согласован _user_cache процесса.
+
+    generation растет при каждом сбросе кеша: снимок, прочитанный из БД до
+    сброса, в кеш уже не попадает.
+    """
+
+    value: Optional[int] = None
+    generation = 0
+
+
+_cache_version = _CacheVersion()
+
+_COLUMNS = tuple(column.key for column in User.__mapper__.column_attrs)
+
+
+def load_user_cached(user_id: int) -> Optional[User]:
+    """Возвращает пользователя для Flask-Login, по возможности без запроса к БД.
+
+    Из кеша берется снимок колонок, из которого собирается detached-объект
+    и подключается к сессии через merge(load=False): SELECT не выполняется,
+    а связи (payments, tickets, ...) по-прежнему загружаются лениво.
+    """
+    snapshot = _user_cache.get(user_id)
+    if snapshot is None:
+        generation = _cache_version.generation
+        user = db.session.get(User, user_id)
+        if user is not None and generation == _cache_version.generation:
+            _user_cache.set(user_id, _snapshot(user), ttl=current_app.config.get("USER_CACHE_TTL"))
+        return user
+
+    user = User(**snapshot)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+
+def invalidate_user(user_id: int) -> None:
+    """Удаляет снимок пользователя из кеша."""
+    _user_cache.delete(user_id)
+
+
+def clear_user_cache() -> None:
+    """Полностью очищает кеш пользователей процесса."""
+    _cache_version.generation += 1
+    _user_cache.clear()
+
+
+def mark_users_changed() -> None:
+    """Увеличивает версию кеша пользователей в текущей транзакции (коммит - у вызывающего).
+
+    Изменения через ORM отмечаются автоматически; массовые UPDATE вызывают
+    ее явно. Кеши всех процессов сбрасываются при следующей проверке
+    sync_user_cache.
+    """
+    CodeSequence.next_value(USER_CACHE_VERSION)
+
+
+def sync_user_cache() -> None:
+    """Фоновая задача: сбрасывает кеши пользователей процесса, если версия в БД изменилась.
+
+    Вместе со снимками сбрасываются статусы подписки: они вычисляются из тех
+    же колонок.
+    """
+    from .subscription_service import clear_subscription_cache
+
+    version = db.session.scalar(
+        select(CodeSequence.value).where(CodeSequence.name == USER_CACHE_VERSION)
+    ) or 0
+    if version != _cache_version.value:
+        clear_user_cache()
+        clear_subscription_cache()
+        _cache_version.value = version
+
+
+def _snapshot(user: User) -> Dict[str, Any]:
+    return {key: getattr(user, key) for key in _COLUMNS}
+
+
+# Любое изменение или удаление User через ORM (пароль, права администратора,
+# подписка, профиль) сбрасывает снимок после успешного коммита, а версия кеша
+# в той же транзакции сбрасывает его в остальных процессах.
+@event.listens_for(Session, "after_flush")
+def _collect_changed_users(session: Session, flush_context) -> None:
+    changed = {obj.id for obj in session.dirty | session.deleted if isinstance(obj, User)}
+    if changed:
+        session.info.setdefault("changed_user_ids", set()).update(changed)
+        mark_users_changed()
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_changed_users(session: Session) -> None:
+    for user_id in session.info.pop("changed_user_ids", ()):
+        invalidate_user(user_id)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _forget_changed_users(session: Session, previous_transaction) -> None:
+    session.info.pop("changed_user_ids", None)
@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import and_, case, func, or_, update
+
+from .. import db
+from ..models import Material, Subject, Ticket, User
+from ..utils.cache import TTLCache
+from ..utils.pagination import keyset_page, prefix_filter
+
+
+# Фильтры списка пользователей в админке (значение параметра filter)
+USER_FILTERS = ("subscribed", "verified", "admin", "expired")
+
+# Счетчики для карточек статистики: один агрегатный запрос раз в 30 секунд
+_stats_cache = TTLCache(maxsize=1, ttl=30)
+
+
+def _filter_condition(name: str):
+    now = datetime.utcnow()
+    if name == "subscribed":
+        return and_(
+            User.is_subscribed.is_(True),
+            or_(User.subscription_expires.is_(None), User.subscription_expires > now),
+        )
+    if name == "verified":
+        return User.is_verified.is_(True)
+    if name == "admin":
+        return User.is_admin.is_(True)
+    if name == "expired":
+        return User.subscription_expires < now
+    return None
+
+
+def search_users(
+    prefix: str = "",
+    after_id: Optional[int] = None,
+    limit: int = 50,
+    status_filter: str = "",
+    descending: bool = False,
+) -> Tuple[List[User], Optional[int]]:
+    """Страница пользователей с поиском по префиксу username/email и фильтром.
+
+    Поиск идет без учета регистра (для латиницы, как прежний LIKE) по индексам
+    lower(username) и lower(email), поэтому префиксный поиск - это
+    диапазонный проход по индексам, а пагинация - по первичному ключу.
+    Флаги фильтров тоже проиндексированы: индекс SQLite содержит rowid,
+    так что «флаг + id > курсор» читается из индекса по порядку.
+    """
+    query = User.query
+    prefix = (prefix or "").strip()
+    if prefix:
+        query = query.filter(
+            or_(
+                prefix_filter(User.username, prefix, ignore_case=True),
+                prefix_filter(User.email, prefix, ignore_case=True),
+            )
+        )
+    condition = _filter_condition(status_filter)
+    if condition is not None:
+        query = query.filter(condition)
+    return keyset_page(query, User.id, after=after_id, limit=limit, descending=descending)
+
+
+def get_user_stats() -> Dict[str, int]:
+    """Количество пользователей для карточек статистики админки.
+
+    Считается одним агрегатным запросом и кешируется на 30 секунд,
+    поэтому страница не загружает пользователей ради подсчета.
+    """
+    stats = _stats_cache.get("stats")
+    if stats is None:
+        row = db.session.query(
+            func.count(User.id),
+            func.count(case((_filter_condition("subscribed"), 1))),
+            func.count(case((User.is_admin.is_(True), 1))),
+        ).one()
+        stats = {"total": row[0], "subscribed": row[1], "admins": row[2]}
+        stats["unsubscribed"] = stats["total"] - stats["subscribed"]
+        _stats_cache.set("stats", stats)
+    return stats
+
+
+def clear_user_stats() -> None:
+    """Сбрасывает закешированные счетчики (после изменений в админке)."""
+    _stats_cache.clear()
+
+
+def release_user_references(user_id: int) -> None:
+    """Обнуляет ссылки на пользователя, которые не удаляются вместе с ним.
+
+    Предметы и материалы, созданные пользователем, и тикеты, которые он
+    обработал как администратор, остаются без автора. Вызывается перед
+    удалением пользователя: при PRAGMA foreign_keys=ON иначе DELETE FROM user
+    падает с IntegrityError.
+    """
+    for column in (Subject.created_by, Material.created_by, Ticket.admin_id):
+        db.session.execute(
+            update(column.class_).where(column == user_id).values({column.key: None})
+            .execution_options(synchronize_session=False)
+        )
+
+
+def serialize_user(user: User) -> dict:
+    """Краткое представление пользователя для выбора в админке."""
+    return {
+        "id": user.id,
+        "username": user.username,
+        "email": user.email,
+        "is_admin": bool(user.is_admin),
+        "is_subscribed": bool(user.is_subscribed),
+    }
+
+
+class LazyUserList:
+    """Ленивая страница пользователей для шаблонов.
+
+    Запрос выполняется только тогда, когда шаблон действительно обращается
+    к списку (итерация, длина, проверка на пустоту), и не больше одного раза.
+    """
+
+    def __init__(self, prefix: str = "", after_id: Optional[int] = None, limit: int = 50) -> None:
+        self.prefix = prefix
+        self.after_id = after_id
+        self.limit = limit
+        self._items: Optional[List[User]] = None
+        self._next_after: Optional[int] = None
+
+    def _load(self) -> List[User]:
+        if self._items is None:
+            self._items, self._next_after = search_users(self.prefix, self.after_id, self.limit)
+        return self._items
+
+    @property
+    def next_after(self) -> Optional[int]:
+        self._load()
+        return self._next_after
+
+    def __iter__(self) -> Iterator[User]:
+        return iter(self._load())
+
+    def __len__(self) -> int:
+        return len(self._load())
+
+    def __bool__(self) -> bool:
+        return bool(self._load())
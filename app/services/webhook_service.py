@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from flask import current_app
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+
+from .. import db
+from ..models import Payment, PaymentWebhookEvent, User
+from ..utils.background import get_periodic_task
+from .payment_status_service import invalidate_payment_status
+from .subscription_service import invalidate_subscription_status
+
+
+def enqueue_webhook_event(data: Optional[Dict[str, Any]]) -> bool:
+    """Сохраняет webhook ЮKassa во входящую очередь.
+
+    Повторная доставка того же события (event + payment_id) отбрасывается
+    уникальным ограничением. Возвращает True, если событие принято
+    (в том числе как дубликат), и False для некорректных данных.
+    """
+    if not data:
+        current_app.logger.error("Пустые данные в webhook")
+        return False
+
+    event = data.get("event")
+    payment_data = data.get("object") or {}
+    payment_id = payment_data.get("id")
+    if not event or not payment_id:
+        current_app.logger.error("Event или Payment ID не найден в webhook")
+        return False
+
+    db.session.add(
+        PaymentWebhookEvent(
+            event=event,
+            payment_id=payment_id,
+            status=payment_data.get("status"),
+            paid=bool(payment_data.get("paid", False)),
+        )
+    )
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        current_app.logger.info(
+            f"Повторный webhook проигнорирован: event={event}, payment_id={payment_id}"
+        )
+        return True
+
+    current_app.logger.info(f"Webhook принят: event={event}, payment_id={payment_id}")
+    _wake_worker()
+    return True
+
+
+def process_webhook_events(batch_size: Optional[int] = None) -> int:
+    """Применяет накопленные webhook-события пачками.
+
+    Пачка сначала захватывается одним UPDATE ... SET processed_at RETURNING:
+    это первая запись транзакции, поэтому параллельные обработчики (лидер и
+    процесс без фоновых задач) получают разные события, а при ошибке откат
+    возвращает пачку в очередь. Дальше на пачку - один запрос за платежами,
+    один за пользователями и один коммит. Возвращает количество обработанных
+    событий.
+    """
+    from ..utils.payment_service import get_payment_service
+
+    batch_size = batch_size or current_app.config.get("PAYMENT_WEBHOOK_BATCH_SIZE", 100)
+    payment_service = get_payment_service()
+    processed = 0
+
+    while True:
+        now = datetime.utcnow()
+        pending = (
+            select(PaymentWebhookEvent.id)
+            .where(PaymentWebhookEvent.processed_at.is_(None))
+            .order_by(PaymentWebhookEvent.id)
+            .limit(batch_size)
+            .scalar_subquery()
+        )
+        events = db.session.execute(
+            update(PaymentWebhookEvent)
+            .where(PaymentWebhookEvent.id.in_(pending))
+            .values(processed_at=now)
+            .returning(
+                PaymentWebhookEvent.id,
+                PaymentWebhookEvent.payment_id,
+                PaymentWebhookEvent.status,
+                PaymentWebhookEvent.paid,
+            )
+            .execution_options(synchronize_session=False)
+        ).all()
+        if not events:
+            db.session.rollback()
+            break
+        events.sort(key=lambda ev: ev.id)
+
+        payment_ids = {ev.payment_id for ev in events}
+        payments = {
+            p.yookassa_payment_id: p
+            for p in Payment.query.filter(Payment.yookassa_payment_id.in_(payment_ids))
+        }
+        # Пользователей загружаем одной выборкой: пока список жив, apply_payment_status
+        # берет их из identity map сессии без отдельных запросов
+        user_ids = {p.user_id for p in payments.values()}
+        users = User.query.filter(User.id.in_(user_ids)).all() if user_ids else []
+
+        touched_users = set()
+        touched_payments = set()
+        for ev in events:
+            payment_record = payments.get(ev.payment_id)
+            if not payment_record:
+                current_app.logger.error(f"Платеж {ev.payment_id} не найден в базе данных")
+                continue
+
+            user = payment_service.apply_payment_status(payment_record, ev.status, ev.paid)
+            touched_payments.add(ev.payment_id)
+            if user:
+                touched_users.add(user.id)
+
+        db.session.commit()
+        for user_id in touched_users:
+            invalidate_subscription_status(user_id)
+        for payment_id in touched_payments:
+            invalidate_payment_status(payment_id)
+        processed += len(events)
+
+        if len(events) < batch_size:
+            break
+
+    if processed:
+        current_app.logger.info(f"Обработано webhook-событий: {processed}")
+    return processed
+
+
+def _wake_worker() -> None:
+    """Будит фоновый обработчик, если он работает в этом процессе.
+
+    В остальных воркерах событие подхватит обработчик процесса-лидера
+    (не позже чем через PAYMENT_WEBHOOK_INTERVAL); очередь обрабатывается
+    прямо в запросе, только если фоновые задачи выключены.
+    """
+    task = get_periodic_task(current_app, "payment-webhooks")
+    if task and task.is_running:
+        task.trigger()
+    elif not current_app.config.get("BACKGROUND_TASKS_ENABLED", True):
+        process_webhook_events()
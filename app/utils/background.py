@@ -0,0 +1,221 @@
+"""
+Периодические фоновые задачи внутри процесса приложения
+"""
+
+import atexit
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from flask import Flask
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировки нет, задачи выполняет каждый процесс
+    fcntl = None
+
+
+class PeriodicTask:
+    """
+    Фоновый поток, который раз в interval секунд вызывает func в контексте приложения
+
+    Задачу можно «разбудить» раньше срока через trigger(), например сразу после
+    записи новых данных, которые она должна обработать.
+    """
+
+    def __init__(self, app: Flask, name: str, func: Callable[[], None], interval: float) -> None:
+        self.app = app
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.per_process = False  # Выполняется в каждом процессе, а не только в лидере
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Запускает поток задачи (повторный вызов безопасен)"""
+        if self.is_running:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name=f"task-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Останавливает поток после текущей итерации"""
+        self._stopped.set()
+        self._wakeup.set()
+
+    @property
+    def is_running(self) -> bool:
+        """True, если поток задачи запущен"""
+        return bool(self._thread and self._thread.is_alive())
+
+    def trigger(self) -> None:
+        """Запускает следующую итерацию немедленно"""
+        self._wakeup.set()
+
+    def run_once(self) -> None:
+        """Выполняет одну итерацию в текущем потоке"""
+        with self.app.app_context():
+            try:
+                self.func()
+            except Exception as e:
+                self.app.logger.error(f"Ошибка фоновой задачи {self.name}: {e}")
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self.run_once()
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+
+
+# Задачи процесса, запущенные или ожидающие лидерства: нужны, чтобы
+# перезапустить потоки после fork()
+_tasks: Dict[str, PeriodicTask] = {}
+_waiting: Dict[str, List[PeriodicTask]] = {}  # Файл блокировки -> общие задачи без лидерства
+_locks: Dict[str, int] = {}  # Файл блокировки -> дескриптор, которым процесс держит flock
+_leader_lock = threading.Lock()
+_watcher: Optional[threading.Thread] = None
+
+
+def default_lock_file(app: Flask) -> str:
+    """Файл блокировки лидера фоновых задач: один на базу данных."""
+    digest = hashlib.sha1(app.config["SQLALCHEMY_DATABASE_URI"].encode("utf-8")).hexdigest()[:12]
+    return os.path.join(tempfile.gettempdir(), f"cysu-tasks-{digest}.lock")
+
+
+def _acquire_leadership(path: str) -> bool:
+    """Пробует стать лидером для path (неблокирующий flock); True, если процесс - лидер."""
+    if fcntl is None:
+        return True
+    with _leader_lock:
+        if path in _locks:
+            return True
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        _locks[path] = fd
+        return True
+
+
+def _watch_leadership(retry: float) -> None:
+    # Лидер мог завершиться: блокировка снимается вместе с процессом
+    while True:
+        time.sleep(retry)
+        for path in list(_waiting):
+            if _acquire_leadership(path):
+                for task in _waiting.pop(path, []):
+                    task.app.logger.info(f"Фоновая задача {task.name} запущена: процесс стал лидером")
+                    task.start()
+
+
+def _wait_for_leadership(path: str, task: PeriodicTask, retry: float) -> None:
+    global _watcher
+    with _leader_lock:
+        _waiting.setdefault(path, []).append(task)
+        if _watcher is None or not _watcher.is_alive():
+            _watcher = threading.Thread(
+                target=_watch_leadership, args=(retry,), name="task-leader-watch", daemon=True
+            )
+            _watcher.start()
+
+
+def _start_task(task: PeriodicTask) -> None:
+    """Запускает задачу процесса или общую задачу, если процесс - лидер."""
+    if task.per_process:
+        task.start()
+        return
+    config = task.app.config
+    path = config.get("BACKGROUND_TASKS_LOCK_FILE") or default_lock_file(task.app)
+    if _acquire_leadership(path):
+        task.start()
+    else:
+        _wait_for_leadership(path, task, config.get("BACKGROUND_TASKS_LEADER_RETRY", 30))
+
+
+def register_periodic_task(
+    app: Flask,
+    name: str,
+    func: Callable[[], None],
+    interval: float,
+    run_at_exit: bool = False,
+    per_process: bool = False,
+) -> PeriodicTask:
+    """
+    Регистрирует задачу в app.extensions и запускает ее, если фоновые задачи включены
+
+    Общие задачи (обработка БД, запросы к ЮKassa) выполняет только один
+    процесс на базу данных - тот, что держит flock на
+    BACKGROUND_TASKS_LOCK_FILE. Остальные воркеры раз в
+    BACKGROUND_TASKS_LEADER_RETRY секунд пробуют занять блокировку и
+    запускают задачи, если лидер завершился.
+
+    Args:
+        app: Приложение Flask
+        name: Уникальное имя задачи
+        func: Функция без аргументов, выполняется в app_context
+        interval: Пауза между запусками (в секундах)
+        run_at_exit: Выполнить задачу еще раз при завершении процесса
+            (например, чтобы записать накопленные в памяти данные)
+        per_process: Задача обрабатывает данные в памяти процесса (буфер
+            кликов, подписчики чата) и запускается в каждом процессе
+
+    Returns:
+        PeriodicTask: Зарегистрированная задача
+    """
+    task = PeriodicTask(app, name, func, interval)
+    task.per_process = per_process
+    app.extensions.setdefault("periodic_tasks", {})[name] = task
+    if app.config.get("BACKGROUND_TASKS_ENABLED", True):
+        _tasks[f"{id(app)}:{name}"] = task
+        _start_task(task)
+    if run_at_exit:
+        atexit.register(task.run_once)
+    return task
+
+
+def get_periodic_task(app: Flask, name: str) -> Optional[PeriodicTask]:
+    """Возвращает зарегистрированную задачу по имени"""
+    return app.extensions.get("periodic_tasks", {}).get(name)
+
+
+def start_periodic_task(app: Flask, name: str) -> Optional[PeriodicTask]:
+    """
+    Запускает одну зарегистрированную задачу при BACKGROUND_TASKS_ENABLED=False
+
+    Нужна процессам, которым из всех задач требуется только своя, например
+    сброс буфера кликов в воркерах redirect.py.
+    """
+    task = get_periodic_task(app, name)
+    if task is not None:
+        _tasks[f"{id(app)}:{name}"] = task
+        _start_task(task)
+    return task
+
+
+def _restart_after_fork() -> None:
+    # Потоки не переживают fork (gunicorn --preload), поднимаем их заново в воркере.
+    # Блокировку лидера держит родитель: унаследованный дескриптор закрываем
+    # (flock при этом не снимается), и общие задачи воркер снова ждет лидерства
+    global _leader_lock, _watcher
+    _leader_lock = threading.Lock()
+    _watcher = None
+    for fd in _locks.values():
+        os.close(fd)
+    _locks.clear()
+    _waiting.clear()
+    for task in _tasks.values():
+        task._thread = None
+        task._wakeup = threading.Event()
+        _start_task(task)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_after_fork)
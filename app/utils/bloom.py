@@ -0,0 +1,50 @@
+"""
+Фильтр Блума для быстрой проверки «такого ключа точно нет»
+"""
+
+import hashlib
+import math
+from typing import Iterable
+
+
+class BloomFilter:
+    """
+    Вероятностное множество строк без удаления
+
+    might_contain возвращает False только для ключей, которые точно не
+    добавлялись; True означает «возможно есть» (ложные срабатывания с
+    вероятностью около error_rate при заполнении до capacity).
+    Позиции битов получаются двойным хешированием одного blake2b.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.001) -> None:
+        """
+        Args:
+            capacity: Ожидаемое количество ключей
+            error_rate: Допустимая доля ложных срабатываний при capacity ключей
+        """
+        capacity = max(1, capacity)
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str) -> Iterable[int]:
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key: str) -> None:
+        """Добавляет ключ"""
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def might_contain(self, key: str) -> bool:
+        """False - ключа точно нет, True - ключ, возможно, есть"""
+        bits = self._bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    __contains__ = might_contain
@@ -0,0 +1,66 @@
+"""
+Keyset-пагинация и префиксный поиск по индексированным колонкам
+"""
+
+from typing import Any, List, Optional, Tuple
+
+from sqlalchemy import and_, func
+
+
+# Верхняя граница для диапазонного префиксного поиска
+_MAX_CHAR = "\U0010ffff"
+
+
+def prefix_filter(column, prefix: str, ignore_case: bool = False):
+    """
+    Условие «column начинается с prefix» в виде диапазона
+
+    В отличие от LIKE 'abc%' (в SQLite без учета регистра и мимо индекса
+    с BINARY-сравнением) диапазон column >= prefix AND column < prefix + MAX
+    выполняется как поиск по индексу колонки. С ignore_case диапазон строится
+    по lower(column) и lower(prefix) - как LIKE, без учета регистра только
+    для ASCII - и использует индекс по выражению lower(column).
+    """
+    if ignore_case:
+        column = func.lower(column)
+        return and_(column >= func.lower(prefix), column < func.lower(prefix + _MAX_CHAR))
+    return and_(column >= prefix, column < prefix + _MAX_CHAR)
+
+
+def keyset_page(
+    query,
+    key_column,
+    after: Optional[Any] = None,
+    limit: int = 50,
+    descending: bool = False,
+) -> Tuple[List[Any], Optional[Any]]:
+    """
+    Возвращает страницу записей, следующих за ключом after
+
+    Args:
+        query: Запрос SQLAlchemy с уже примененными фильтрами
+        key_column: Уникальная индексированная колонка сортировки (обычно id)
+        after: Ключ последней записи предыдущей страницы
+        limit: Размер страницы
+        descending: Сортировка по убыванию (новые записи первыми)
+
+    Returns:
+        Tuple[List[Any], Optional[Any]]: (записи, ключ для следующей страницы или None)
+    """
+    limit = max(1, limit)  # LIMIT с отрицательным значением в SQLite снимает ограничение
+    if after is not None:
+        query = query.filter(key_column < after if descending else key_column > after)
+    query = query.order_by(key_column.desc() if descending else key_column.asc())
+    items = query.limit(limit + 1).all()
+
+    next_after = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_after = getattr(items[-1], key_column.key)
+    return items, next_after
+
+
+def parse_cursor(value: Optional[str]) -> Optional[int]:
+    """Разбирает числовой курсор из параметра запроса"""
+    value = (value or "").strip()
+    return int(value) if value.isdigit() else None
@@ -5,8 +5,11 @@
 import uuid
 from datetime import datetime, timedelta
 from ..models import db, Payment, User
-from flask import current_app
-from typing import Dict, Any
+from ..services.subscription_service import invalidate_subscription_status
+from flask import Flask, current_app
+from typing import Dict, Any, Optional
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import requests
 import base64
 
@@ -14,21 +17,58 @@ import base64
 class YooKassaService:
     """Сервис для работы с платежами ЮKassa"""
 
-    def __init__(self) -> None:
+    def __init__(self, app: Optional[Flask] = None) -> None:
         """Инициализация сервиса с настройками из конфигурации"""
-        self.shop_id = current_app.config["YOOKASSA_SHOP_ID"]
-        self.secret_key = current_app.config["YOOKASSA_SECRET_KEY"]
-        self.base_url = "https://api.yookassa.ru/v3"
+        app = app or current_app._get_current_object()
+        self.logger = app.logger
+        self.shop_id = app.config["YOOKASSA_SHOP_ID"]
+        self.secret_key = app.config["YOOKASSA_SECRET_KEY"]
+        self.base_url = app.config.get("YOOKASSA_API_URL", "https://api.yookassa.ru/v3")
+        self.timeout = (
+            app.config.get("YOOKASSA_CONNECT_TIMEOUT", 3.05),
+            app.config.get("YOOKASSA_READ_TIMEOUT", 10),
+        )
+        self._auth_header = self._get_auth_header()
+        self.session = self._create_session(
+            max_retries=app.config.get("YOOKASSA_MAX_RETRIES", 3),
+            backoff_factor=app.config.get("YOOKASSA_RETRY_BACKOFF", 0.5),
+            pool_size=app.config.get("YOOKASSA_POOL_SIZE", 10),
+        )
 
         # Проверяем, что ключи настроены корректно
         if not self.shop_id or not self.secret_key:
-            current_app.logger.warning(
+            self.logger.warning(
                 "Ключи ЮKassa не настроены, используется режим симуляции"
             )
             self.simulation_mode = True
         else:
             self.simulation_mode = False
-            current_app.logger.info("Режим реальных платежей ЮKassa активирован")
+            self.logger.info("Режим реальных платежей ЮKassa активирован")
+
+    @staticmethod
+    def _create_session(
+        max_retries: int, backoff_factor: float, pool_size: int
+    ) -> requests.Session:
+        """
+        Создает HTTP-сессию с пулом keep-alive соединений и повторами
+
+        POST повторяется так же, как GET: каждый логический запрос несет
+        один Idempotence-Key, и ЮKassa не создаст платеж повторно.
+        """
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset({"GET", "POST"}),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size, max_retries=retry
+        )
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
 
     def _get_auth_header(self) -> str:
         """Создает заголовок авторизации для API ЮKassa"""
@@ -78,34 +118,36 @@ class YooKassaService:
             Dict[str, Any]: Ответ от API
         """
         if self.simulation_mode:
-            current_app.logger.info(f"Симуляция API запроса: {method} {endpoint}")
+            self.logger.info(f"Симуляция API запроса: {method} {endpoint}")
             return {"simulation": True, "status": "success"}
 
         url = f"{self.base_url}/{endpoint}"
         headers = {
-            "Authorization": f"Basic {self._get_auth_header()}",
+            "Authorization": f"Basic {self._auth_header}",
             "Content-Type": "application/json",
             "Idempotence-Key": str(uuid.uuid4()),
         }
 
         try:
             if method == "GET":
-                response = requests.get(url, headers=headers)
+                response = self.session.get(url, headers=headers, timeout=self.timeout)
             elif method == "POST":
-                response = requests.post(url, headers=headers, json=data)
+                response = self.session.post(
+                    url, headers=headers, json=data, timeout=self.timeout
+                )
             else:
                 raise ValueError(f"Неподдерживаемый HTTP метод: {method}")
 
             if response.status_code == 200:
                 return response.json()
             else:
-                current_app.logger.error(
+                self.logger.error(
                     f"Ошибка API ЮKassa: {response.status_code} - {response.text}"
                 )
                 return {"error": f"HTTP {response.status_code}"}
 
         except requests.exceptions.RequestException as e:
-            current_app.logger.error(f"Ошибка сетевого запроса к ЮKassa: {str(e)}")
+            self.logger.error(f"Ошибка сетевого запроса к ЮKassa: {str(e)}")
             return {"error": str(e)}
 
     def create_smart_payment(
@@ -298,9 +340,9 @@ class YooKassaService:
 
             if self.simulation_mode:
                 # Для симуляции всегда возвращаем успешный статус
-                payment_record.status = "succeeded"
-                payment_record.updated_at = datetime.utcnow()
+                self.apply_payment_status(payment_record, "succeeded", paid=True)
                 db.session.commit()
+                invalidate_subscription_status(payment_record.user_id)
 
                 current_app.logger.info(
                     f"Симуляция: платеж {payment_id} помечен как успешный"
@@ -326,9 +368,13 @@ class YooKassaService:
                     return api_response
 
                 # Обновляем статус в базе данных
-                payment_record.status = api_response.get("status", "pending")
-                payment_record.updated_at = datetime.utcnow()
+                self.apply_payment_status(
+                    payment_record,
+                    api_response.get("status", "pending"),
+                    paid=api_response.get("paid", False),
+                )
                 db.session.commit()
+                invalidate_subscription_status(payment_record.user_id)
 
                 return {
                     "payment_id": payment_id,
@@ -373,7 +419,8 @@ class YooKassaService:
                 current_app.logger.error(f"Платеж {payment_id} не найден в базе данных")
                 return False
 
-            # Проверяем статус платежа
+            # get_payment_status сохраняет статус и при первом переходе
+            # в succeeded активирует подписку
             payment_status = self.get_payment_status(payment_id)
 
             if payment_status.get("status") != "succeeded":
@@ -382,27 +429,8 @@ class YooKassaService:
                 )
                 return False
 
-            # Активируем подписку пользователя
-            user = User.query.get(payment_record.user_id)
-            if user:
-                user.is_subscribed = True
-
-                # Определяем период подписки по сумме платежа
-                subscription_days = self._get_subscription_days(payment_record.amount)
-                user.subscription_expires = datetime.utcnow() + timedelta(
-                    days=subscription_days
-                )
-
-                payment_record.status = "succeeded"
-                payment_record.updated_at = datetime.utcnow()
-
-                db.session.commit()
-                current_app.logger.info(
-                    f"Подписка активирована для пользователя {user.username} на {subscription_days} дней"
-                )
-                return True
-
-            return False
+            current_app.logger.info(f"Платеж {payment_id} успешно обработан")
+            return True
 
         except Exception as e:
             current_app.logger.error(
@@ -410,10 +438,94 @@ class YooKassaService:
             )
             return False
 
+    def close(self) -> None:
+        """Закрывает пул HTTP-соединений"""
+        self.session.close()
+
+    def activate_subscription(self, user: User, payment_record: Payment) -> int:
+        """
+        Продлевает подписку пользователя по успешному платежу
+
+        Единственное место, где платежи записывают subscription_expires:
+        дальнейшие проверки подписки только сравнивают эту дату с текущим временем.
+        Коммит выполняет вызывающий код.
+
+        Параметры:
+            user (User): Пользователь
+            payment_record (Payment): Успешный платеж
+
+        Возвращает:
+            int: Количество дней подписки
+        """
+        subscription_days = self._get_subscription_days(payment_record.amount)
+        user.is_subscribed = True
+        user.is_manual_subscription = False
+        user.subscription_expires = datetime.utcnow() + timedelta(
+            days=subscription_days
+        )
+        return subscription_days
+
+    def apply_payment_status(
+        self, payment_record: Payment, status: str, paid: bool = False
+    ) -> Optional[User]:
+        """
+        Сохраняет новый статус платежа и активирует подписку при первом успехе
+
+        Используется всеми путями обновления статуса (webhook, сверка,
+        ручная проверка), поэтому подписка продлевается ровно один раз
+        на платеж. Коммит выполняет вызывающий код.
+
+        Параметры:
+            payment_record (Payment): Платеж
+            status (str): Новый статус из ЮKassa
+            paid (bool): Признак оплаты из ЮKassa
+
+        Возвращает:
+            Optional[User]: Пользователь, если подписка была активирована
+        """
+        already_succeeded = payment_record.status == "succeeded"
+        payment_record.status = status or "pending"
+        payment_record.updated_at = datetime.utcnow()
+
+        if status != "succeeded" or not paid or already_succeeded:
+            return None
+
+        user = db.session.get(User, payment_record.user_id)
+        if not user:
+            return None
+
+        subscription_days = self.activate_subscription(user, payment_record)
+        self.logger.info(
+            f"Подписка активирована для пользователя {user.username} на {subscription_days} дней"
+        )
+        return user
+
+    def fetch_payment(self, payment_id: str) -> Dict[str, Any]:
+        """
+        Запрашивает платеж в API ЮKassa без обращения к БД
+
+        Безопасно вызывать из рабочих потоков без контекста приложения.
+
+        Параметры:
+            payment_id (str): ID платежа
+
+        Возвращает:
+            Dict[str, Any]: Ответ API (или {"error": ...})
+        """
+        if self.simulation_mode:
+            return {"id": payment_id, "status": "succeeded", "paid": True}
+        return self._make_api_request(f"payments/{payment_id}")
+
     def check_user_subscription(self, user: User) -> bool:
         """
         Проверяет активность подписки пользователя
 
+        Проверка ничего не записывает: subscription_expires поддерживают
+        платежи и админка, а флаг is_subscribed у истекших подписок и у
+        подписок без оплаты сбрасывает фоновая задача expire_subscriptions.
+        Подписка, выданная вручную, активна до subscription_expires (без даты -
+        бессрочно); оплаченная - только при наличии успешного платежа.
+
         Параметры:
             user (User): Пользователь для проверки
 
@@ -423,45 +535,33 @@ class YooKassaService:
         if not user.is_subscribed:
             return False
 
-        # Если подписка выдана вручную администратором, пропускаем проверку платежей
+        expires = user.subscription_expires
+        if expires is not None and expires < datetime.utcnow():
+            return False
+
         if user.is_manual_subscription:
-            current_app.logger.info(
-                f"Пользователь {user.username} имеет ручно выданную подписку"
-            )
-            if (
-                user.subscription_expires
-                and user.subscription_expires < datetime.utcnow()
-            ):
-                # Подписка истекла
-                user.is_subscribed = False
-                user.is_manual_subscription = False
-                db.session.commit()
-                current_app.logger.info(
-                    f"Ручная подписка пользователя {user.username} истекла"
-                )
-                return False
             return True
 
-        # Проверяем, есть ли успешный платеж для этой подписки
+        # Подписка без успешного платежа недействительна. ORDER BY created_at
+        # ведет поиск по индексу (user_id, created_at), а не по индексу статуса
         successful_payment = (
-            Payment.query.filter_by(user_id=user.id, status="succeeded")
+            db.session.query(Payment.id)
+            .filter_by(user_id=user.id, status="succeeded")
             .order_by(Payment.created_at.desc())
             .first()
         )
+        return successful_payment is not None
 
-        if not successful_payment:
-            # Нет успешного платежа - сбрасываем подписку
-            user.is_subscribed = False
-            db.session.commit()
-            current_app.logger.warning(
-                f"Пользователь {user.username} имеет подписку без успешного платежа - сброс"
-            )
-            return False
 
-        if user.subscription_expires and user.subscription_expires < datetime.utcnow():
-            # Подписка истекла
-            user.is_subscribed = False
-            db.session.commit()
-            return False
+def get_payment_service() -> YooKassaService:
+    """
+    Возвращает общий для процесса экземпляр YooKassaService
 
-        return True
+    Экземпляр создается один раз на приложение и хранится в app.extensions,
+    поэтому конфигурация читается и пул соединений создается однократно.
+    """
+    app = current_app._get_current_object()
+    service = app.extensions.get("yookassa")
+    if service is None:
+        service = app.extensions["yookassa"] = YooKassaService(app)
+    return service
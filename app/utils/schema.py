@@ -0,0 +1,78 @@
+"""
+Доведение схемы существующей БД до текущих моделей
+"""
+
+from typing import List
+
+from flask import current_app
+
+
+def ensure_columns() -> List[str]:
+    """
+    Добавляет в существующие таблицы столбцы моделей, которых нет в БД
+
+    Добавляются только столбцы, допускающие NULL (ALTER TABLE ... ADD COLUMN);
+    заполнение значениями для старых строк остается за вызывающим кодом.
+    Вызывается до ensure_indexes, чтобы индексы по новым столбцам создались.
+
+    Returns:
+        List[str]: Имена добавленных столбцов в виде "таблица.столбец"
+    """
+    from sqlalchemy import inspect, text
+
+    from .. import db
+
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    added = []
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                if not column.nullable or column.primary_key:
+                    current_app.logger.warning(
+                        f"Столбец {table.name}.{column.name} нельзя добавить автоматически (NOT NULL)"
+                    )
+                    continue
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                connection.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+                added.append(f"{table.name}.{column.name}")
+
+    if added:
+        current_app.logger.info(f"Добавлены столбцы: {', '.join(added)}")
+    return added
+
+
+def ensure_indexes() -> List[str]:
+    """
+    Создает индексы моделей, которых нет в БД
+
+    db.create_all() создает индексы только вместе с новыми таблицами, поэтому
+    для уже существующих таблиц недостающие индексы добавляются здесь
+    (CREATE INDEX для каждого отсутствующего индекса). Имена существующих
+    индексов читаются из sqlite_master: рефлексия SQLAlchemy пропускает
+    индексы по выражениям (например, lower(username)).
+
+    Returns:
+        List[str]: Имена созданных индексов
+    """
+    from sqlalchemy import text
+
+    from .. import db
+
+    with db.engine.connect() as connection:
+        existing = set(connection.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'")).scalars())
+    created = []
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=db.engine)
+                created.append(index.name)
+
+    if created:
+        current_app.logger.info(f"Созданы индексы: {', '.join(created)}")
+    return created
@@ -0,0 +1,80 @@
+"""
+Короткие коды ссылок из порядкового номера без коллизий и проверочных запросов
+
+Номер из последовательности отображается в код так:
+    1. выбирается длина: первые 62^3 номеров - 3 символа, следующие 62^4 -
+       4 символа, затем 5 и т.д. (длина растет плавно, без скачка до 8);
+    2. номер внутри своей длины переставляется ключевой биективной
+       перестановкой (сеть Фейстеля + cycle walking), чтобы соседние номера
+       давали непохожие, неугадываемые коды;
+    3. результат записывается в base62 фиксированной длины.
+
+Разные номера всегда дают разные коды, поэтому уникальность гарантируется
+без SELECT перед вставкой.
+"""
+
+import hashlib
+import hmac
+
+ALPHABET = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+BASE = len(ALPHABET)
+MIN_LENGTH = 3
+
+# Количество раундов сети Фейстеля
+_ROUNDS = 4
+
+
+def encode_base62(value: int, length: int) -> str:
+    """Записывает число в base62 строкой ровно из length символов"""
+    chars = []
+    for _ in range(length):
+        value, digit = divmod(value, BASE)
+        chars.append(ALPHABET[digit])
+    if value:
+        raise ValueError("Число не помещается в заданную длину")
+    return "".join(reversed(chars))
+
+
+def permute(value: int, domain: int, key: bytes, tweak: str = "") -> int:
+    """
+    Ключевая биекция [0, domain) -> [0, domain)
+
+    Сеть Фейстеля работает на ближайшем сверху четном числе бит; если
+    результат выходит за domain, перестановка применяется повторно
+    (cycle walking). Домен занимает больше четверти блока, поэтому
+    в среднем требуется меньше двух дополнительных шагов.
+    """
+    if not 0 <= value < domain:
+        raise ValueError("Значение вне домена перестановки")
+    bits = max(2, (domain - 1).bit_length())
+    bits += bits % 2
+    half = bits // 2
+    mask = (1 << half) - 1
+
+    x = value
+    while True:
+        left, right = x >> half, x & mask
+        for round_index in range(_ROUNDS):
+            digest = hmac.new(key, f"{tweak}:{round_index}:{right}".encode(), hashlib.sha256).digest()
+            left, right = right, left ^ (int.from_bytes(digest[:8], "big") & mask)
+        x = (left << half) | right
+        if x < domain:
+            return x
+
+
+def sequence_to_code(sequence: int, key: bytes) -> str:
+    """
+    Код ссылки для порядкового номера (начиная с 0)
+
+    Args:
+        sequence: Номер из последовательности кодов
+        key: Секретный ключ перестановки
+
+    Returns:
+        str: Уникальный для этого номера код из MIN_LENGTH и более символов
+    """
+    length = MIN_LENGTH
+    while sequence >= BASE ** length:
+        sequence -= BASE ** length
+        length += 1
+    return encode_base62(permute(sequence, BASE ** length, key, tweak=str(length)), length)
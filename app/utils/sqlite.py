@@ -0,0 +1,63 @@
+"""
+Настройка соединений SQLite (PRAGMA при каждом подключении)
+"""
+
+import re
+from typing import Dict
+
+from flask import Flask
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# Имена и значения PRAGMA подставляются в SQL, поэтому допускаем только слова и числа
+_PRAGMA_TOKEN = re.compile(r"^-?\w+$")
+
+
+def build_sqlite_pragmas(env) -> Dict[str, str]:
+    """
+    Собирает PRAGMA из переменных окружения (пустое значение - не задавать)
+
+    Порядок важен: busy_timeout ставится первым, чтобы смена journal_mode
+    тоже ждала блокировку, а не падала с «database is locked».
+    """
+    pragmas = {
+        "busy_timeout": env.get("SQLITE_BUSY_TIMEOUT", "5000"),
+        "journal_mode": env.get("SQLITE_JOURNAL_MODE", "WAL"),
+        "synchronous": env.get("SQLITE_SYNCHRONOUS", "NORMAL"),
+        "cache_size": env.get("SQLITE_CACHE_SIZE", "-20000"),
+        "mmap_size": env.get("SQLITE_MMAP_SIZE", "268435456"),
+        "temp_store": env.get("SQLITE_TEMP_STORE", "MEMORY"),
+        "foreign_keys": env.get("SQLITE_FOREIGN_KEYS", "ON"),
+    }
+    return {name: value.strip() for name, value in pragmas.items() if value and value.strip()}
+
+
+def register_sqlite_pragmas(app: Flask, engine: Engine) -> None:
+    """
+    Выполняет PRAGMA из app.config['SQLITE_PRAGMAS'] на каждом новом соединении
+
+    Для других СУБД ничего не делает.
+    """
+    if engine.dialect.name != "sqlite":
+        return
+
+    pragmas = app.config.get("SQLITE_PRAGMAS") or {}
+    for name, value in pragmas.items():
+        if not (_PRAGMA_TOKEN.match(str(name)) and _PRAGMA_TOKEN.match(str(value))):
+            raise ValueError(f"Недопустимая PRAGMA SQLite: {name}={value}")
+    if not pragmas:
+        return
+
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+    app.logger.info(
+        "SQLite PRAGMA: " + ", ".join(f"{name}={value}" for name, value in pragmas.items())
+    )
@@ -8,6 +8,8 @@ from flask import (
     current_app,
     jsonify,
     session,
+    Response,
+    stream_with_context,
 )
 from flask_login import login_user, logout_user, login_required, current_user
 from .models import (
@@ -37,8 +39,25 @@ from .forms import (
     PasswordResetForm,
     ShortenForm,
 )
-from . import db, login_manager
-from .utils.payment_service import YooKassaService
+from . import db, login_manager, csrf
+from .utils.payment_service import get_payment_service
+from .services.user_cache import load_user_cached
+from .services.user_directory import (
+    USER_FILTERS,
+    LazyUserList,
+    clear_user_stats,
+    get_user_stats,
+    release_user_references,
+    search_users,
+    serialize_user,
+)
+from .utils.pagination import parse_cursor
+from .services.webhook_service import enqueue_webhook_event
+from .services.payment_status_service import get_payment_status_cached
+from .services.subscription_service import (
+    get_subscription_status,
+    invalidate_subscription_status,
+)
 from .utils.email_service import EmailService
 from werkzeug.security import check_password_hash, generate_password_hash
 from werkzeug.utils import secure_filename
@@ -47,17 +66,33 @@ import string
 from sqlalchemy.orm import joinedload
 from datetime import datetime, timedelta
 import json
+import queue
 import re
+import time
+from .services.chat_buffer import chat_buffer, render_messages
+from .services.chat_hub import chat_hub
+from .services.chat_service import (
+    get_latest_message_id,
+    get_messages,
+    message_payload,
+    with_viewer,
+)
+from .services.click_analytics import get_click_stats
 from .services.shortlink_service import (
+    bulk_create_short_links,
+    bulk_results_csv,
+    bulk_results_json,
+    read_csv_rows,
     create_short_link,
     normalize_url,
     parse_ttl,
     parse_max_clicks,
-    check_access,
-    register_click,
+    resolve_short_link,
     reset_clicks,
     update_rule,
     delete_short_link,
+    list_short_links,
+    SHORTLINK_FILTERS,
 )
 
 bp = Blueprint("main", __name__)
@@ -79,7 +114,7 @@ def inject_json_parser():
 @login_manager.user_loader
 def load_user(user_id):
     try:
-        return User.query.get(int(user_id))
+        return load_user_cached(int(user_id))
     except Exception as e:
         current_app.logger.error(f"Error loading user {user_id}: {e}")
         return None
@@ -93,8 +128,7 @@ def index():
     if current_user.is_authenticated:
         # Проверяем подписку пользователя
         try:
-            payment_service = YooKassaService()
-            is_subscribed = payment_service.check_user_subscription(current_user)
+            is_subscribed = get_subscription_status(current_user)
         except Exception as e:
             current_app.logger.error(f"Error checking subscription in index: {e}")
             is_subscribed = False
@@ -157,7 +191,7 @@ def subscription():
             )
 
             # Создаем сервис платежей
-            payment_service = YooKassaService()
+            payment_service = get_payment_service()
             current_app.logger.info("Сервис платежей создан")
 
             # Создаем "Умный платеж" с выбранной ценой
@@ -209,74 +243,18 @@ def subscription():
 
 
 @bp.route("/payment/webhook", methods=["POST"])
+@csrf.exempt
 def payment_webhook():
-    """Обработка webhook'ов от ЮKassa"""
+    """Прием webhook'ов от ЮKassa: событие кладется в очередь, обработка в фоне"""
     try:
-        # Получаем данные от ЮKassa
-        data = request.get_json()
-        current_app.logger.info(f"Получен webhook от ЮKassa: {data}")
-
-        if not data:
-            current_app.logger.error("Пустые данные в webhook")
-            return "OK", 200
-
-        # Проверяем тип события
-        event = data.get("event")
-        payment_data = data.get("object", {})
-        payment_id = payment_data.get("id")
-
-        if not payment_id:
-            current_app.logger.error("Payment ID не найден в webhook")
-            return "OK", 200
-
-        current_app.logger.info(
-            f"Обработка webhook: event={event}, payment_id={payment_id}"
-        )
-
-        # Находим платеж в базе данных
-        payment_record = Payment.query.filter_by(yookassa_payment_id=payment_id).first()
-
-        if not payment_record:
-            current_app.logger.error(f"Платеж {payment_id} не найден в базе данных")
-            return "OK", 200
-
-        # Обновляем статус платежа
-        payment_record.status = payment_data.get("status", "pending")
-        payment_record.updated_at = datetime.utcnow()
-
-        # Если платеж успешен, активируем подписку
-        if payment_data.get("status") == "succeeded" and payment_data.get(
-            "paid", False
-        ):
-            current_app.logger.info(f"Платеж {payment_id} успешен, активируем подписку")
-
-            user = User.query.get(payment_record.user_id)
-            if user:
-                user.is_subscribed = True
-
-                # Определяем период подписки по сумме платежа
-                payment_service = YooKassaService()
-                subscription_days = payment_service._get_subscription_days(
-                    payment_record.amount
-                )
-                user.subscription_expires = datetime.utcnow() + timedelta(
-                    days=subscription_days
-                )
-
-                current_app.logger.info(
-                    f"Подписка активирована для пользователя {user.username} на {subscription_days} дней"
-                )
-
-        db.session.commit()
-        current_app.logger.info(
-            f"Webhook обработан успешно: payment_id={payment_id}, status={payment_data.get('status')}"
-        )
-
+        enqueue_webhook_event(request.get_json(silent=True))
         return "OK", 200
 
     except Exception as e:
-        current_app.logger.error(f"Ошибка обработки webhook: {str(e)}")
-        return "OK", 200  # Всегда возвращаем 200, чтобы ЮKassa не повторял запрос
+        current_app.logger.error(f"Ошибка приема webhook: {str(e)}")
+        db.session.rollback()
+        # Событие не сохранено - пусть ЮKassa доставит его повторно
+        return "Error", 500
 
 
 @bp.route("/payment/success")
@@ -314,10 +292,6 @@ def payment_success():
             flash("Ошибка поиска платежей. Попробуйте оформить подписку снова.", "error")
             return redirect(url_for("main.subscription"))
 
-    # Создаем сервис платежей
-    payment_service = YooKassaService()
-    current_app.logger.info("Обработка платежа")
-
     # Проверяем, что платеж существует и принадлежит текущему пользователю
     try:
         payment_record = Payment.query.filter_by(
@@ -348,49 +322,24 @@ def payment_success():
 
     current_app.logger.info(f"Платеж найден: {payment_record.status}")
 
-    # Проверяем статус платежа в ЮKassa
-    payment_status = payment_service.get_payment_status(payment_id)
-    current_app.logger.info(f"Статус платежа от ЮKassa: {payment_status}")
+    # Статус берем из БД (его обновляют webhook'и и фоновая сверка);
+    # если платеж еще pending, один раз сверяем его с ЮKassa
+    payment_status = get_payment_status_cached(payment_id, refresh_pending=True)
+    current_app.logger.info(f"Статус платежа: {payment_status.get('status')}")
 
     if "error" in payment_status:
         current_app.logger.error(f"Ошибка получения статуса: {payment_status['error']}")
-
-        # Если это режим симуляции или ошибка связана с API, обрабатываем платеж локально
-        if payment_service.simulation_mode or "HTTP 401" in str(
-            payment_status["error"]
-        ):
-            current_app.logger.info(
-                "Обработка платежа в режиме симуляции или при ошибке API"
-            )
-            if payment_service.process_successful_payment(payment_id):
-                current_app.logger.info("Подписка успешно активирована")
-                flash("Платеж успешно обработан! Подписка активирована.", "success")
-            else:
-                current_app.logger.error("Ошибка при активации подписки")
-                flash(
-                    "Произошла ошибка при активации подписки. Обратитесь в поддержку.",
-                    "error",
-                )
-        else:
-            flash(
-                f"Ошибка при проверке платежа: {payment_status['error']}. Обратитесь в поддержку.",
-                "error",
-            )
+        flash(
+            f"Ошибка при проверке платежа: {payment_status['error']}. Обратитесь в поддержку.",
+            "error",
+        )
     elif payment_status.get("status") == "succeeded":
-        current_app.logger.info("Платеж успешен, активируем подписку")
-        # Обрабатываем успешный платеж
-        if payment_service.process_successful_payment(payment_id):
-            current_app.logger.info("Подписка успешно активирована")
-            flash(
-                "Подписка успешно оформлена! Теперь у вас есть доступ ко всем материалам.",
-                "success",
-            )
-        else:
-            current_app.logger.error("Ошибка при активации подписки")
-            flash(
-                "Произошла ошибка при активации подписки. Обратитесь в поддержку.",
-                "error",
-            )
+        # Подписка активируется при сохранении статуса succeeded
+        current_app.logger.info("Платеж успешен, подписка активирована")
+        flash(
+            "Подписка успешно оформлена! Теперь у вас есть доступ ко всем материалам.",
+            "success",
+        )
     elif payment_status.get("status") == "pending":
         current_app.logger.info("Платеж в обработке")
         flash(
@@ -436,7 +385,7 @@ def payment_status():
         payment_id = form.payment_id.data
         try:
             # Создаем сервис платежей
-            payment_service = YooKassaService()
+            payment_service = get_payment_service()
             status = payment_service.get_payment_status(payment_id)
 
             if "error" in status:
@@ -455,8 +404,7 @@ def payment_status():
 def api_payment_status(payment_id):
     """API для проверки статуса платежа"""
     try:
-        payment_service = YooKassaService()
-        status = payment_service.get_payment_status(payment_id)
+        status = get_payment_status_cached(payment_id)
         return jsonify(status)
     except Exception as e:
         current_app.logger.error(f"Error in api_payment_status: {e}")
@@ -468,10 +416,8 @@ def api_payment_status(payment_id):
 def profile():
     """Страница профиля пользователя"""
     try:
-        # Создаем сервис платежей
-        payment_service = YooKassaService()
         # Проверяем актуальность подписки
-        is_subscribed = payment_service.check_user_subscription(current_user)
+        is_subscribed = get_subscription_status(current_user)
     except Exception as e:
         current_app.logger.error(f"Error checking subscription in profile: {e}")
         is_subscribed = False
@@ -494,10 +440,8 @@ def subject_detail(subject_id):
     # Проверяем подписку для аутентифицированных пользователей
     if current_user.is_authenticated:
         try:
-            # Создаем сервис платежей
-            payment_service = YooKassaService()
             # Проверяем подписку пользователя
-            if not payment_service.check_user_subscription(current_user):
+            if not get_subscription_status(current_user):
                 flash("Для доступа к предметам необходима активная подписка.", "warning")
                 return redirect(url_for("main.subscription"))
         except Exception as e:
@@ -941,19 +885,15 @@ def shorten_page():
 @bp.route("/l/<string:code>")
 def resolve_shortlink(code: str):
     """Редирект по короткому коду"""
-    current_app.logger.info(f"shortlink: resolve attempt code={code}")
-    link = ShortLink.query.filter_by(code=code).first()
-    if not link:
-        current_app.logger.info(f"shortlink: not found code={code}")
+    url, reason = resolve_short_link(code, request.referrer or "")
+    if reason == "not_found":
+        current_app.logger.debug(f"shortlink: not found code={code}")
         return redirect(url_for('main.not_found'))
-    # Проверяем правила
-    allowed, reason = check_access(link)
-    if not allowed:
-        current_app.logger.info(f"shortlink: blocked reason={reason}")
+    if reason:
+        current_app.logger.debug(f"shortlink: blocked code={code} reason={reason}")
         return redirect(url_for('main.shortlink_expired'))
-    register_click(link)
-    current_app.logger.info(f"shortlink: redirecting to original clicks_now={link.clicks}")
-    return redirect(link.original_url)
+    current_app.logger.debug(f"shortlink: redirect code={code}")
+    return redirect(url)
 
 
 @bp.route("/l/expired")
@@ -976,10 +916,8 @@ def handle_404(error):
 def material_detail(material_id):
     material = Material.query.get_or_404(material_id)
 
-    # Создаем сервис платежей
-    payment_service = YooKassaService()
     # Проверяем подписку пользователя
-    if not payment_service.check_user_subscription(current_user):
+    if not get_subscription_status(current_user):
         flash("Для доступа к материалам необходима активная подписка.", "warning")
         return redirect(url_for("main.subscription"))
 
@@ -1020,9 +958,8 @@ def add_solution_file(material_id):
 def submit_solution(material_id):
     material = Material.query.get_or_404(material_id)
 
-    # Создаем сервис платежей и проверяем подписку
-    payment_service = YooKassaService()
-    if not payment_service.check_user_subscription(current_user):
+    # Проверяем подписку
+    if not get_subscription_status(current_user):
         flash("Для загрузки решений необходима активная подписка.", "warning")
         return redirect(url_for("main.subscription"))
 
@@ -1268,15 +1205,40 @@ def admin_users():
                             f"Удалено уведомлений: {notifications_count}"
                         )
 
-                        # Удаляем сообщения тикетов
-                        ticket_messages_count = TicketMessage.query.filter_by(
-                            user_id=user.id
-                        ).count()
-                        TicketMessage.query.filter_by(user_id=user.id).delete()
+                        # Удаляем сообщения тикетов: свои и ответы в тикетах пользователя
+                        # (при foreign_keys=ON тикет нельзя удалить, пока на него ссылаются)
+                        ticket_ids = [
+                            ticket_id
+                            for (ticket_id,) in db.session.query(Ticket.id).filter_by(
+                                user_id=user.id
+                            )
+                        ]
+                        ticket_messages_query = TicketMessage.query.filter(
+                            (TicketMessage.user_id == user.id)
+                            | TicketMessage.ticket_id.in_(ticket_ids)
+                        )
+                        ticket_messages_count = ticket_messages_query.count()
+                        ticket_messages_query.delete(synchronize_session=False)
                         current_app.logger.info(
                             f"Удалено сообщений тикетов: {ticket_messages_count}"
                         )
 
+                        # Удаляем файлы тикетов (записи и файлы на диске)
+                        from .utils.file_storage import FileStorageManager
+
+                        TicketFile.query.filter(TicketFile.ticket_id.in_(ticket_ids)).delete(
+                            synchronize_session=False
+                        )
+                        for ticket_id in ticket_ids:
+                            if FileStorageManager.delete_ticket_files(ticket_id):
+                                current_app.logger.info(
+                                    f"Файлы тикета {ticket_id} успешно удалены"
+                                )
+                            else:
+                                current_app.logger.warning(
+                                    f"Ошибка при удалении файлов тикета {ticket_id}"
+                                )
+
                         # Удаляем тикеты пользователя
                         tickets_count = Ticket.query.filter_by(user_id=user.id).count()
                         Ticket.query.filter_by(user_id=user.id).delete()
@@ -1315,8 +1277,6 @@ def admin_users():
                         )
 
                         # Удаляем файлы пользователя с использованием FileStorageManager
-                        from .utils.file_storage import FileStorageManager
-
                         if FileStorageManager.delete_user_files(user.id):
                             current_app.logger.info(
                                 f"Файлы пользователя {user.id} успешно удалены"
@@ -1326,16 +1286,9 @@ def admin_users():
                                 f"Ошибка при удалении файлов пользователя {user.id}"
                             )
 
-                        # Удаляем файлы тикетов
-                        for ticket in Ticket.query.filter_by(user_id=user.id).all():
-                            if FileStorageManager.delete_ticket_files(ticket.id):
-                                current_app.logger.info(
-                                    f"Файлы тикета {ticket.id} успешно удалены"
-                                )
-                            else:
-                                current_app.logger.warning(
-                                    f"Ошибка при удалении файлов тикета {ticket.id}"
-                                )
+                        # Созданные предметы и материалы, обработанные тикеты
+                        # остаются без автора
+                        release_user_references(user.id)
 
                         # Удаляем самого пользователя
                         db.session.delete(user)
@@ -1426,6 +1379,7 @@ def admin_users():
                     status = "выдана на 30 дней"
 
                 db.session.commit()
+                invalidate_subscription_status(user.id)
                 current_app.logger.info(
                     f"Подписка успешно изменена: {user.username} - {status}"
                 )
@@ -1502,20 +1456,48 @@ def admin_users():
             db.session.rollback()
             flash("Ошибка обновления правил короткой ссылки", "error")
 
-    # Получаем все короткие ссылки
+    if request.method == "POST":
+        clear_user_stats()
+
+    page_size = current_app.config["ADMIN_USERS_PAGE_SIZE"]
+
+    # Страница коротких ссылок: новые первыми, поиск по префиксу кода
+    links_query = request.args.get("links_q", "").strip()
+    links_filter = request.args.get("links_filter", "")
+    if links_filter not in SHORTLINK_FILTERS:
+        links_filter = ""
     try:
-        short_links = ShortLink.query.order_by(ShortLink.created_at.desc()).all()
+        short_links, links_next_after = list_short_links(
+            prefix=links_query,
+            status_filter=links_filter,
+            after_id=parse_cursor(request.args.get("links_after")),
+            limit=page_size,
+        )
+        # Переходы за сутки - из почасовых агрегатов, без чтения сырых событий
+        link_stats = get_click_stats(link.id for link in short_links)
     except Exception as e:
         current_app.logger.error(f"Error loading short links: {e}")
-        short_links = []
+        short_links, links_next_after, link_stats = [], None, {}
         flash("Ошибка загрузки коротких ссылок.", "error")
 
-    # Получаем всех пользователей с информацией о подписке
+    # Страница пользователей: новые первыми, поиск по префиксу username/email
+    users_query = request.args.get("q", "").strip()
+    users_filter = request.args.get("filter", "")
+    if users_filter not in USER_FILTERS:
+        users_filter = ""
     try:
-        users = User.query.all()
+        users, users_next_after = search_users(
+            prefix=users_query,
+            after_id=parse_cursor(request.args.get("after")),
+            limit=page_size,
+            status_filter=users_filter,
+            descending=True,
+        )
+        user_stats = get_user_stats()
     except Exception as e:
         current_app.logger.error(f"Error loading users: {e}")
-        users = []
+        users, users_next_after = [], None
+        user_stats = {"total": 0, "subscribed": 0, "admins": 0, "unsubscribed": 0}
         flash("Ошибка загрузки пользователей.", "error")
 
     return render_template(
@@ -1525,6 +1507,14 @@ def admin_users():
         password_map=password_map,
         message=message,
         short_links=short_links,
+        user_stats=user_stats,
+        users_query=users_query,
+        users_filter=users_filter,
+        users_next_after=users_next_after,
+        links_query=links_query,
+        links_filter=links_filter,
+        links_next_after=links_next_after,
+        link_stats=link_stats,
     )
 
 
@@ -1534,19 +1524,119 @@ def inject_admin_users():
     """
     Context processor для передачи списка пользователей в шаблоны.
 
+    Список ленивый и постраничный: запрос к БД выполняется, только если
+    шаблон действительно обращается к users.
+
     Возвращает:
         dict: Словарь с ключом 'users' для использования в шаблонах
     """
+    if current_user.is_authenticated and current_user.is_admin:
+        users = LazyUserList(limit=current_app.config["ADMIN_USERS_PAGE_SIZE"])
+    else:
+        users = []
+    return dict(users=users)
+
+
+@bp.route("/api/admin/users")
+@login_required
+def api_admin_users():
+    """API выбора пользователя в админке: keyset-пагинация и поиск по префиксу"""
+    if not current_user.is_admin:
+        return jsonify({"success": False, "error": "Доступ запрещен"}), 403
+
     try:
-        users = (
-            User.query.all()
-            if current_user.is_authenticated and current_user.is_admin
-            else []
+        page_size = current_app.config["ADMIN_USERS_PAGE_SIZE"]
+        limit = max(1, min(request.args.get("limit", page_size, type=int) or page_size, 200))
+        users, next_after = search_users(
+            prefix=request.args.get("q", ""),
+            after_id=parse_cursor(request.args.get("after")),
+            limit=limit,
+        )
+        return jsonify(
+            {
+                "success": True,
+                "users": [serialize_user(u) for u in users],
+                "next_after": next_after,
+            }
         )
     except Exception as e:
-        current_app.logger.error(f"Error in inject_admin_users: {e}")
-        users = []
-    return dict(users=users)
+        current_app.logger.error(f"Ошибка получения списка пользователей: {str(e)}")
+        return jsonify({"success": False, "error": "Ошибка получения пользователей"}), 500
+
+
+@bp.route("/api/admin/shortlinks/bulk", methods=["POST"])
+@login_required
+def api_admin_shortlinks_bulk():
+    """
+    Массовое создание коротких ссылок (только для админов)
+
+    Принимает JSON {"links": [{"url", "ttl", "max_clicks"} | "url", ...],
+    "ttl", "max_clicks", "format"} или multipart-форму с CSV-файлом file
+    (столбцы url[,ttl[,max_clicks]]) и полями ttl, max_clicks, format.
+    ttl и max_clicks верхнего уровня применяются к строкам без своих значений.
+
+    Ссылки и правила вставляются пачками по SHORTLINK_BULK_BATCH_SIZE в одной
+    транзакции на пачку; коды отдаются потоком в CSV (по умолчанию) или JSON
+    по мере коммита пачек, в порядке входных строк.
+    """
+    if not current_user.is_admin:
+        return jsonify({"success": False, "error": "Доступ запрещен"}), 403
+
+    payload = request.get_json(silent=True) if request.is_json else None
+    if payload is not None:
+        if not isinstance(payload, dict) or not isinstance(payload.get("links"), list):
+            return jsonify({"success": False, "error": "Ожидается список links"}), 400
+        rows = [
+            {"url": item} if isinstance(item, str) else
+            {key: str(item.get(key) or "") for key in ("url", "ttl", "max_clicks")}
+            for item in payload["links"] if isinstance(item, (str, dict))
+        ]
+        options = payload
+    elif "file" in request.files:
+        text = request.files["file"].read().decode("utf-8-sig", errors="replace")
+        rows = list(read_csv_rows(text.splitlines()))
+        options = request.form
+    else:
+        return jsonify({"success": False, "error": "Передайте JSON со списком links или CSV-файл file"}), 400
+
+    max_rows = current_app.config["SHORTLINK_BULK_MAX_ROWS"]
+    if len(rows) > max_rows:
+        return jsonify({"success": False, "error": f"Не больше {max_rows} ссылок за запрос"}), 413
+
+    output_format = (request.args.get("format") or options.get("format") or "csv").lower()
+    if output_format not in ("csv", "json"):
+        return jsonify({"success": False, "error": "format должен быть csv или json"}), 400
+
+    results = bulk_create_short_links(
+        rows,
+        batch_size=current_app.config["SHORTLINK_BULK_BATCH_SIZE"],
+        default_ttl=str(options.get("ttl") or ""),
+        default_max_clicks=str(options.get("max_clicks") or ""),
+    )
+
+    def generate():
+        created = 0
+        try:
+            for result in results:
+                if result["code"]:
+                    created += 1
+                    result["short_url"] = url_for("main.resolve_shortlink", code=result["code"], _external=True)
+                yield result
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"Ошибка массового создания коротких ссылок: {str(e)}")
+            raise
+        finally:
+            current_app.logger.info(
+                f"Массовое создание коротких ссылок: создано {created} из {len(rows)} (admin_id={current_user.id})"
+            )
+
+    if output_format == "json":
+        body, mimetype, headers = bulk_results_json(generate()), "application/json", {}
+    else:
+        body, mimetype = bulk_results_csv(generate()), "text/csv"
+        headers = {"Content-Disposition": "attachment; filename=shortlinks.csv"}
+    return Response(stream_with_context(body), mimetype=mimetype, headers=headers)
 
 
 @bp.app_context_processor
@@ -1560,8 +1650,7 @@ def inject_subscription_status():
     is_subscribed = False
     if current_user.is_authenticated:
         try:
-            payment_service = YooKassaService()
-            is_subscribed = payment_service.check_user_subscription(current_user)
+            is_subscribed = get_subscription_status(current_user)
         except Exception as e:
             current_app.logger.error(f"Error in inject_subscription_status: {e}")
             is_subscribed = False
@@ -1808,35 +1897,107 @@ def wiki():
 @bp.route("/chat/messages")
 @login_required
 def get_chat_messages():
-    """Получение последних 150 сообщений чата"""
+    """
+    Сообщения чата: последние 150 или, с ?after_id=N, только новее N
+
+    Ответ помечается ETag по окну сообщений - id последнего, нижней границе и
+    числу сообщений (удаление сообщения меняет границу или число, даже если
+    последний id прежний), и по пользователю, так как is_own зависит от него.
+    С Cache-Control: no-cache браузер перепроверяет его при каждом опросе.
+    Окно последних сообщений хранится
+    в chat_buffer уже закодированным в JSON: на опрос приходится один запрос
+    сверки с БД, а если новых сообщений нет, отдается 304 без тела.
+    """
     try:
-        messages = (
-            ChatMessage.query.order_by(ChatMessage.created_at.desc()).limit(150).all()
-        )
-        messages.reverse()  # Возвращаем в хронологическом порядке
-
-        messages_data = []
-        for msg in messages:
-            messages_data.append(
-                {
-                    "id": msg.id,
-                    "user_id": msg.user_id,
-                    "username": msg.user.username,
-                    "message": msg.message,
-                    "file_path": msg.file_path,
-                    "file_name": msg.file_name,
-                    "file_type": msg.file_type,
-                    "created_at": msg.created_at.strftime("%H:%M"),
-                    "is_own": msg.user_id == current_user.id,
-                }
-            )
-
-        return jsonify({"success": True, "messages": messages_data})
+        window = chat_buffer.sync()
+        etag = f"chat-{window.latest_id}-{window.floor}-{len(window.entries)}-{current_user.id}"
+        if etag in request.if_none_match:
+            response = current_app.response_class(status=304)
+        else:
+            body = render_messages(window, parse_cursor(request.args.get("after_id")), current_user.id)
+            response = current_app.response_class(body, mimetype="application/json")
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = "private, no-cache"
+        return response
     except Exception as e:
         current_app.logger.error(f"Ошибка получения сообщений чата: {str(e)}")
         return jsonify({"success": False, "error": "Ошибка получения сообщений"})
 
 
+@bp.route("/chat/stream")
+@login_required
+def chat_stream():
+    """
+    Поток новых сообщений чата (Server-Sent Events)
+
+    Клиент передает последний известный id в заголовке Last-Event-ID (его
+    браузер сам отправляет при переподключении) или в ?after_id. Пропущенное
+    догружается одним запросом по первичному ключу, дальше сообщения приходят
+    из chat_hub без обращений к БД на каждое соединение. Соединение
+    закрывается через CHAT_STREAM_MAX_AGE секунд, браузер переподключается
+    сам; если поток недоступен (503), клиент возвращается к опросу
+    /chat/messages.
+    """
+    config = current_app.config
+    if not config.get("CHAT_STREAM_ENABLED", False):
+        return jsonify({"success": False, "error": "Поток сообщений отключен"}), 503
+    # Потоки занимают не больше половины потоков воркера, остальные - обычным запросам
+    limit = config.get("CHAT_STREAM_MAX_SUBSCRIBERS", 0)
+    if config.get("WORKER_THREADS"):
+        limit = min(limit, config["WORKER_THREADS"] // 2)
+
+    after_id = parse_cursor(request.headers.get("Last-Event-ID") or request.args.get("after_id"))
+    viewer_id = current_user.id
+    # Подписка до догрузки из БД: сообщение, записанное между ними, придет
+    # из очереди, а повтор отсекается по id
+    subscription = chat_hub.subscribe(after_id or get_latest_message_id(), limit)
+    if subscription is None:
+        return jsonify({"success": False, "error": "Слишком много подключений к чату"}), 503
+    try:
+        backlog = [message_payload(msg) for msg in get_messages(after_id=after_id)[0]] if after_id else []
+    except Exception:
+        chat_hub.unsubscribe(subscription)
+        raise
+    finally:
+        # Соединение живет минутами: не держим подключение к БД
+        db.session.remove()
+
+    keepalive = config.get("CHAT_STREAM_KEEPALIVE", 15)
+    max_age = config.get("CHAT_STREAM_MAX_AGE", 300)
+
+    def event(payload):
+        data = json.dumps(with_viewer(payload, viewer_id), ensure_ascii=False)
+        return f"id: {payload['id']}\ndata: {data}\n\n"
+
+    def generate():
+        last_id = subscription.after_id
+        deadline = time.monotonic() + max_age
+        try:
+            yield "retry: 3000\n\n"
+            for payload in backlog:
+                last_id = max(last_id, payload["id"])
+                yield event(payload)
+            while time.monotonic() < deadline:
+                try:
+                    payload = subscription.queue.get(timeout=keepalive)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                if payload is None:
+                    break  # Хаб отключил отстающего подписчика
+                if payload["id"] <= last_id:
+                    continue
+                last_id = payload["id"]
+                yield event(payload)
+        finally:
+            chat_hub.unsubscribe(subscription)
+
+    response = Response(generate(), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
 @bp.route("/chat/send", methods=["POST"])
 @login_required
 def send_chat_message():
@@ -1925,20 +2086,11 @@ def send_chat_message():
         # Возвращаем данные нового сообщения
         current_app.logger.info(f"Сообщение успешно сохранено с ID: {chat_message.id}")
 
-        response_data = {
-            "success": True,
-            "message": {
-                "id": chat_message.id,
-                "user_id": chat_message.user_id,
-                "username": current_user.username,
-                "message": chat_message.message,
-                "file_path": chat_message.file_path,
-                "file_name": chat_message.file_name,
-                "file_type": chat_message.file_type,
-                "created_at": chat_message.created_at.strftime("%H:%M"),
-                "is_own": True,
-            },
-        }
+        # Подписчики /chat/stream этого процесса получают сообщение сразу
+        payload = message_payload(chat_message, username=current_user.username)
+        chat_hub.publish([payload])
+        chat_buffer.append(payload)
+        response_data = {"success": True, "message": with_viewer(payload, current_user.id)}
 
         current_app.logger.info("=== УСПЕШНОЕ ЗАВЕРШЕНИЕ ОТПРАВКИ ===")
         return jsonify(response_data)
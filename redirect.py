@@ -0,0 +1,21 @@
+from app import create_app
+from app.redirect_app import ShortlinkRedirectApp
+from app.utils.background import start_periodic_task
+
+# Отдельная точка входа для воркеров, обслуживающих только короткие ссылки:
+#   gunicorn -w 8 -b 0.0.0.0:8002 redirect:app
+# Прокси направляет сюда /l/<code>, остальные запросы (в том числе /l/expired
+# и /404) этот процесс тоже умеет обслужить через полный стек Flask.
+# Платежи, архив ссылок, чат и прочие общие задачи выполняет основное
+# приложение; здесь нужны только сброс буфера кликов, проверка версии кеша
+# ссылок и догрузка фильтра кодов этого процесса
+flask_app = create_app({'BACKGROUND_TASKS_ENABLED': False})
+start_periodic_task(flask_app, 'shortlink-clicks')
+start_periodic_task(flask_app, 'shortlink-cache')
+start_periodic_task(flask_app, 'shortlink-codes')
+app = ShortlinkRedirectApp(flask_app, fallback=flask_app.wsgi_app)
+
+if __name__ == '__main__':
+    from werkzeug.serving import run_simple
+
+    run_simple('0.0.0.0', 8002, app)
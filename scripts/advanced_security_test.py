@@ -43,7 +43,7 @@ class SecurityTester:
     """Класс для комплексного тестирования безопасности"""
     
     def __init__(self):
-        self.app = create_app()
+        self.app = create_app({"BACKGROUND_TASKS_ENABLED": False})
         self.test_results = []
         self.vulnerabilities_found = []
         self.security_score = 100
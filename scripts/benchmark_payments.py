@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест платежного контура cysu на локальной заглушке ЮKassa.
+
+Прогоняет через реальный HTTP-путь (_make_api_request с пулом соединений,
+таймаутами и повторами):
+    1. create_smart_payment
+    2. get_payment_status
+    3. POST /payment/webhook (быстрый путь) и время разбора очереди
+
+и печатает пропускную способность и p50/p95/p99 для каждой фазы.
+Используется временная БД, app.db не затрагивается.
+
+Использование:
+    python3 scripts/benchmark_payments.py
+    python3 scripts/benchmark_payments.py --requests 500 --concurrency 16 --latency-ms 80 --error-rate 0.05
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+from app.models import PaymentWebhookEvent, User
+from app.utils.payment_service import get_payment_service
+from scripts.fake_yookassa import start_server
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Перцентиль по методу ближайшего ранга."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def run_phase(app, name: str, func: Callable[[Any], bool], items: List[Any], concurrency: int) -> Dict[str, Any]:
+    """Выполняет func для каждого элемента в пуле потоков и собирает задержки."""
+
+    def call(item: Any):
+        with app.app_context():
+            started = time.perf_counter()
+            try:
+                ok = func(item)
+            except Exception:
+                ok = False
+            finally:
+                db.session.remove()
+            return time.perf_counter() - started, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(call, items))
+    elapsed = time.perf_counter() - started
+
+    latencies = [r[0] * 1000 for r in results]
+    errors = sum(1 for r in results if not r[1])
+    report = {
+        "phase": name,
+        "count": len(results),
+        "errors": errors,
+        "rps": len(results) / elapsed if elapsed else 0.0,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "max": max(latencies) if latencies else 0.0,
+    }
+    print(
+        f"   {name:<22} n={report['count']:<6} err={report['errors']:<5} "
+        f"{report['rps']:8.1f} req/s   p50={report['p50']:7.1f}ms  "
+        f"p95={report['p95']:7.1f}ms  p99={report['p99']:7.1f}ms  max={report['max']:7.1f}ms"
+    )
+    return report
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Бенчмарк платежного контура cysu")
+    parser.add_argument("--requests", type=int, default=200, help="Количество платежей")
+    parser.add_argument("--concurrency", type=int, default=8, help="Параллельных клиентов")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Задержка заглушки")
+    parser.add_argument("--jitter-ms", type=float, default=20.0, help="Разброс задержки (±)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ответов 500")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="Доля «зависших» ответов")
+    parser.add_argument("--read-timeout", type=float, default=2.0, help="YOOKASSA_READ_TIMEOUT")
+    parser.add_argument("--max-retries", type=int, default=3, help="YOOKASSA_MAX_RETRIES")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str]) -> None:
+    args = parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix="cysu-bench-")
+
+    server, state = start_server(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        hang_rate=args.hang_rate,
+        hang_ms=args.read_timeout * 1000 * 2,
+        succeed_after=-1,
+    )
+    host, port = server.server_address[:2]
+
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "LOG_FILE": os.path.join(workdir, "bench.log"),
+        "LOG_LEVEL": "WARNING",
+        "YOOKASSA_API_URL": f"http://{host}:{port}/v3",
+        "YOOKASSA_SHOP_ID": "bench-shop",
+        "YOOKASSA_SECRET_KEY": "bench-secret",
+        "YOOKASSA_READ_TIMEOUT": args.read_timeout,
+        "YOOKASSA_MAX_RETRIES": args.max_retries,
+        "YOOKASSA_RETRY_BACKOFF": 0.05,
+        "YOOKASSA_POOL_SIZE": args.concurrency,
+    })
+
+    with app.app_context():
+        user = User(username="bench_user", email="bench@example.com", password="-")
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+        price = app.config["SUBSCRIPTION_PRICES"]["1"]
+
+    print("🏁 Бенчмарк платежного контура cysu")
+    print(f"   Заглушка ЮKassa: http://{host}:{port}/v3 (задержка {args.latency_ms}±{args.jitter_ms} мс, "
+          f"ошибки {args.error_rate:.0%}, зависания {args.hang_rate:.0%})")
+    print(f"   Запросов: {args.requests}, параллельность: {args.concurrency}, БД: {workdir}")
+    print("=" * 100)
+
+    payment_ids: List[str] = []
+
+    def create(_: int) -> bool:
+        payment = get_payment_service().create_smart_payment(
+            db.session.get(User, user_id), "http://localhost/payment/success", price
+        )
+        payment_ids.append(payment["payment_id"])
+        return True
+
+    def status(payment_id: str) -> bool:
+        return "error" not in get_payment_service().get_payment_status(payment_id)
+
+    def webhook(payment_id: str) -> bool:
+        body = {
+            "type": "notification",
+            "event": "payment.succeeded",
+            "object": {"id": payment_id, "status": "succeeded", "paid": True},
+        }
+        return app.test_client().post("/payment/webhook", json=body).status_code == 200
+
+    run_phase(app, "create_smart_payment", create, list(range(args.requests)), args.concurrency)
+    run_phase(app, "get_payment_status", status, list(payment_ids), args.concurrency)
+    run_phase(app, "payment_webhook", webhook, list(payment_ids), args.concurrency)
+
+    started = time.perf_counter()
+    with app.app_context():
+        while PaymentWebhookEvent.query.filter(PaymentWebhookEvent.processed_at.is_(None)).count():
+            time.sleep(0.05)
+    print(f"   {'webhook queue drain':<22} {time.perf_counter() - started:.3f}s после последнего webhook")
+
+    print("=" * 100)
+    print(f"📊 Заглушка: {state.stats}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест редиректов коротких ссылок cysu (GET /l/<code>).
+
+Фазы:
+    1. cold       - кеш ссылок очищается перед каждым запросом (поиск в SQLite)
+    2. cached     - горячие ссылки уже в кеше процесса
+    3. full stack - то же, но через полный стек Flask (SHORTLINK_FAST_PATH=False)
+    4. unknown    - случайные несуществующие коды (перебор ботами), отсекаются
+                    фильтром кодов без запросов к БД
+
+Для каждой фазы печатаются пропускная способность и p50/p95/p99.
+Используется временная БД, app.db не затрагивается.
+
+Использование:
+    python3 scripts/benchmark_shortlinks.py
+    python3 scripts/benchmark_shortlinks.py --requests 20000 --links 1000 --concurrency 8
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import string
+import sys
+import tempfile
+from typing import List
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+from app.models import ShortLink
+from app.services.shortlink_service import clear_short_link_cache
+from scripts.benchmark_payments import run_phase
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Бенчмарк редиректов коротких ссылок cysu")
+    parser.add_argument("--requests", type=int, default=5000, help="Количество редиректов в фазе")
+    parser.add_argument("--links", type=int, default=500, help="Количество ссылок в БД")
+    parser.add_argument("--hot", type=int, default=50, help="Сколько ссылок получают весь трафик")
+    parser.add_argument("--concurrency", type=int, default=4, help="Параллельных клиентов")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str]) -> None:
+    args = parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix="cysu-shortlinks-")
+
+    config = {
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "LOG_FILE": os.path.join(workdir, "bench.log"),
+        "LOG_LEVEL": "WARNING",
+        "BACKGROUND_TASKS_ENABLED": False,
+    }
+    app = create_app(config)
+    full_stack_app = create_app({**config, "SHORTLINK_FAST_PATH": False})
+
+    with app.app_context():
+        links = [
+            ShortLink(code=f"b{i:05d}", original_url=f"https://example.com/page/{i}")
+            for i in range(args.links)
+        ]
+        db.session.add_all(links)
+        db.session.commit()
+        codes: List[str] = [link.code for link in links[: args.hot]]
+
+    traffic = [random.choice(codes) for _ in range(args.requests)]
+    unknown = ["".join(random.choices(string.ascii_letters, k=6)) for _ in range(args.requests)]
+
+    def redirect(code: str) -> bool:
+        return app.test_client().get(f"/l/{code}").status_code == 302
+
+    def cold_redirect(code: str) -> bool:
+        clear_short_link_cache()
+        return redirect(code)
+
+    print("🏁 Бенчмарк редиректов коротких ссылок cysu")
+    print(f"   Ссылок: {args.links}, горячих: {args.hot}, запросов: {args.requests}, "
+          f"параллельность: {args.concurrency}, БД: {workdir}")
+    print("=" * 100)
+    run_phase(app, "cold", cold_redirect, traffic, args.concurrency)
+    run_phase(app, "cached", redirect, traffic, args.concurrency)
+    run_phase(app, "unknown", lambda code: app.test_client().get(f"/l/{code}").status_code == 302, unknown, args.concurrency)
+    run_phase(
+        full_stack_app,
+        "full stack",
+        lambda code: full_stack_app.test_client().get(f"/l/{code}").status_code == 302,
+        traffic,
+        args.concurrency,
+    )
+    print("=" * 100)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест SQLite cysu: несколько процессов-воркеров (как gunicorn -w N)
+одновременно читают и пишут в одну БД.
+
+Прогон выполняется дважды на свежих временных БД:
+    1. before - без PRAGMA (rollback journal, настройки SQLite по умолчанию)
+    2. after  - с PRAGMA из SQLITE_PRAGMAS (WAL, busy_timeout, mmap и т.д.)
+
+Каждый воркер создает приложение через create_app и в цикле выполняет
+запросы, похожие на горячие пути сайта:
+    чтение - последние сообщения чата, пользователь по id, ссылка по коду
+    запись - новое сообщение чата, +1 клик короткой ссылки
+
+и печатает операции в секунду, p95 записи и число ошибок «database is locked».
+app.db не затрагивается.
+
+Использование:
+    python3 scripts/benchmark_sqlite.py
+    python3 scripts/benchmark_sqlite.py --workers 8 --duration 10 --write-ratio 0.3
+"""
+
+from __future__ import annotations
+
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import update
+from sqlalchemy.exc import OperationalError
+
+from app import create_app, db
+from app.models import ChatMessage, ShortLink, User
+from app.utils.sqlite import build_sqlite_pragmas
+from scripts.benchmark_payments import percentile
+
+
+def make_config(workdir: str, pragmas: Dict[str, str]) -> Dict[str, Any]:
+    return {
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "SQLITE_PRAGMAS": pragmas,
+        "LOG_FILE": os.path.join(workdir, "bench.log"),
+        "LOG_LEVEL": "WARNING",
+        "BACKGROUND_TASKS_ENABLED": False,
+    }
+
+
+def seed(config: Dict[str, Any], messages: int) -> None:
+    """Создает таблицы, пользователя, ссылку и историю чата."""
+    app = create_app(config)
+    with app.app_context():
+        user = User(username="bench_user", email="bench@example.com", password="-")
+        db.session.add(user)
+        db.session.add(ShortLink(code="bnc", original_url="http://example.com"))
+        db.session.flush()
+        db.session.add_all(
+            ChatMessage(user_id=user.id, message=f"Сообщение {i}") for i in range(messages)
+        )
+        db.session.commit()
+        db.engine.dispose()
+
+
+def worker(config: Dict[str, Any], duration: float, write_ratio: float, results) -> None:
+    """Цикл чтений и записей одного воркера; итог кладется в очередь results."""
+    app = create_app(config)
+    stats = {"reads": 0, "writes": 0, "locked": 0, "write_ms": []}
+    rnd = random.Random(os.getpid())
+
+    with app.app_context():
+        user_id = db.session.query(User.id).scalar()
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            is_write = rnd.random() < write_ratio
+            try:
+                if is_write:
+                    if rnd.random() < 0.5:
+                        db.session.add(ChatMessage(user_id=user_id, message="bench"))
+                    else:
+                        db.session.execute(
+                            update(ShortLink)
+                            .where(ShortLink.code == "bnc")
+                            .values(clicks=ShortLink.clicks + 1)
+                        )
+                    db.session.commit()
+                    stats["writes"] += 1
+                    stats["write_ms"].append((time.perf_counter() - started) * 1000)
+                else:
+                    ChatMessage.query.order_by(ChatMessage.id.desc()).limit(50).all()
+                    User.query.filter_by(id=user_id).first()
+                    ShortLink.query.filter_by(code="bnc").first()
+                    db.session.commit()
+                    stats["reads"] += 1
+            except OperationalError as e:
+                db.session.rollback()
+                if "locked" not in str(e) and "busy" not in str(e):
+                    raise
+                stats["locked"] += 1
+        db.session.remove()
+
+    results.put(stats)
+
+
+def run(name: str, pragmas: Dict[str, str], args: argparse.Namespace) -> None:
+    workdir = tempfile.mkdtemp(prefix=f"cysu-sqlite-{name}-")
+    config = make_config(workdir, pragmas)
+    seed(config, args.messages)
+
+    ctx = multiprocessing.get_context("fork" if hasattr(os, "fork") else "spawn")
+    results = ctx.Queue()
+    processes = [
+        ctx.Process(target=worker, args=(config, args.duration, args.write_ratio, results))
+        for _ in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    collected: List[Dict[str, Any]] = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    # Каждый воркер нагружает БД ровно duration секунд (без учета create_app)
+    elapsed = args.duration
+
+    reads = sum(r["reads"] for r in collected)
+    writes = sum(r["writes"] for r in collected)
+    locked = sum(r["locked"] for r in collected)
+    write_ms = [ms for r in collected for ms in r["write_ms"]]
+    print(
+        f"   {name:<7} reads={reads / elapsed:8.1f}/s  writes={writes / elapsed:7.1f}/s  "
+        f"write p95={percentile(write_ms, 95):7.1f}ms  p99={percentile(write_ms, 99):7.1f}ms  "
+        f"locked={locked}"
+    )
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Бенчмарк SQLite cysu: до и после PRAGMA")
+    parser.add_argument("--workers", type=int, default=4, help="Количество процессов-воркеров")
+    parser.add_argument("--duration", type=float, default=5.0, help="Длительность прогона (сек)")
+    parser.add_argument("--write-ratio", type=float, default=0.2, help="Доля операций записи")
+    parser.add_argument("--messages", type=int, default=2000, help="Сообщений чата в исходной БД")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str]) -> None:
+    args = parse_args(argv)
+    pragmas = build_sqlite_pragmas(os.environ)
+
+    print("🏁 Бенчмарк SQLite cysu")
+    print(f"   Воркеров: {args.workers}, длительность: {args.duration}s, доля записей: {args.write_ratio:.0%}")
+    print(f"   PRAGMA after: {', '.join(f'{k}={v}' for k, v in pragmas.items())}")
+    print("=" * 100)
+    run("before", {}, args)
+    run("after", pragmas, args)
+    print("=" * 100)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Массовое создание коротких ссылок cysu из CSV.
+
+Входной CSV: столбцы url[,ttl[,max_clicks]], строка заголовка необязательна.
+ttl - '3h', '6h' или пусто; max_clicks - число или пусто. --ttl и
+--max-clicks применяются к строкам без своих значений.
+
+Ссылки и правила вставляются пачками (одна транзакция на пачку), коды
+печатаются в CSV или JSON по мере коммита пачек, в порядке входных строк.
+
+Использование:
+    python3 scripts/bulk_shortlinks.py links.csv --base-url https://cysu.ru
+    cat urls.txt | python3 scripts/bulk_shortlinks.py - --ttl 6h --max-clicks 5 --format json
+    python3 scripts/bulk_shortlinks.py links.csv --batch-size 1000 --output codes.csv
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+from typing import Any, Dict, Iterator
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from app.services.shortlink_service import (
+    bulk_create_short_links,
+    bulk_results_csv,
+    bulk_results_json,
+    read_csv_rows,
+)
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Массовое создание коротких ссылок cysu")
+    parser.add_argument("input", help="CSV-файл со ссылками или '-' для stdin")
+    parser.add_argument("--ttl", default="", choices=["", "3h", "6h"], help="Срок жизни по умолчанию")
+    parser.add_argument("--max-clicks", default="", help="Лимит переходов по умолчанию")
+    parser.add_argument("--batch-size", type=int, default=None,
+                        help="Ссылок в одной транзакции (по умолчанию SHORTLINK_BULK_BATCH_SIZE)")
+    parser.add_argument("--format", default="csv", choices=["csv", "json"], help="Формат результата")
+    parser.add_argument("--base-url", default="", help="Адрес сайта для колонки short_url, например https://cysu.ru")
+    parser.add_argument("--output", default="-", help="Файл результата или '-' для stdout")
+    return parser.parse_args(argv)
+
+
+def with_short_urls(results: Iterator[Dict[str, Any]], base_url: str) -> Iterator[Dict[str, Any]]:
+    """Добавляет short_url к созданным ссылкам, если задан --base-url."""
+    for result in results:
+        if result["code"] and base_url:
+            result["short_url"] = f"{base_url.rstrip('/')}/l/{result['code']}"
+        yield result
+
+
+def main(argv: list[str]) -> int:
+    args = parse_args(argv)
+    app = create_app({"BACKGROUND_TASKS_ENABLED": False})
+
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8-sig", newline="")
+    target = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8", newline="")
+    started = time.perf_counter()
+    stats = {"created": 0, "failed": 0}
+
+    def counted(results: Iterator[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        for result in results:
+            stats["created" if result["code"] else "failed"] += 1
+            yield result
+
+    try:
+        with app.app_context():
+            results = bulk_create_short_links(
+                read_csv_rows(source),
+                batch_size=args.batch_size or app.config["SHORTLINK_BULK_BATCH_SIZE"],
+                default_ttl=args.ttl,
+                default_max_clicks=args.max_clicks,
+            )
+            results = counted(with_short_urls(results, args.base_url))
+            writer = bulk_results_json if args.format == "json" else bulk_results_csv
+            for chunk in writer(results):
+                target.write(chunk)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if target is not sys.stdout:
+            target.close()
+
+    elapsed = time.perf_counter() - started
+    print(
+        f"✅ Создано ссылок: {stats['created']}, пропущено строк: {stats['failed']} за {elapsed:.2f}с",
+        file=sys.stderr,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
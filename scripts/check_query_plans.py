@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Проверка планов выполнения горячих запросов cysu (EXPLAIN QUERY PLAN).
+
+Для каждого запроса из HOT_QUERIES (повторяют запросы views.py и сервисов)
+строится план SQLite. Проверка падает (код выхода 1), если запрос:
+    - читает таблицу целиком (SCAN <таблица> без индекса)
+    - сортирует результат во временном B-дереве (USE TEMP B-TREE)
+
+По умолчанию используется временная БД со схемой из моделей; с --db
+проверяется существующая БД (недостающие индексы будут созданы при
+запуске приложения).
+
+Использование:
+    python3 scripts/check_query_plans.py
+    python3 scripts/check_query_plans.py --db app.db --verbose
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import re
+import sys
+import tempfile
+from datetime import datetime
+from typing import Callable, List, Tuple
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import joinedload
+
+from app import create_app, db
+from app.models import (
+    ChatMessage,
+    CodeSequence,
+    EmailVerification,
+    Material,
+    Notification,
+    PasswordReset,
+    Payment,
+    PaymentWebhookEvent,
+    ShortLink,
+    ShortLinkArchive,
+    ShortLinkClickHourly,
+    ShortLinkRule,
+    Submission,
+    Ticket,
+    TicketFile,
+    TicketMessage,
+    User,
+)
+from app.services.chat_service import select_chat_messages
+from app.services.shortlink_service import claim_click_statement
+from app.utils.pagination import prefix_filter
+
+NOW = datetime(2024, 1, 1)
+
+# (название, функция, возвращающая SELECT или UPDATE)
+HOT_QUERIES: List[Tuple[str, Callable]] = [
+    ("последний платеж пользователя", lambda: select(Payment).where(Payment.user_id == 1)
+        .order_by(Payment.created_at.desc()).limit(1)),
+    ("успешный платеж пользователя", lambda: select(Payment.id)
+        .where(Payment.user_id == 1, Payment.status == "succeeded")
+        .order_by(Payment.created_at.desc()).limit(1)),
+    ("платеж по ID ЮKassa", lambda: select(Payment).where(Payment.yookassa_payment_id == "x")),
+    ("сверка pending-платежей", lambda: select(Payment)
+        .where(Payment.status == "pending", Payment.created_at >= NOW)
+        .order_by(Payment.created_at.desc()).limit(100)),
+    ("очередь webhook'ов", lambda: select(PaymentWebhookEvent)
+        .where(PaymentWebhookEvent.processed_at.is_(None)).order_by(PaymentWebhookEvent.id).limit(100)),
+    ("непрочитанные уведомления", lambda: select(Notification)
+        .where(Notification.user_id == 1, Notification.is_read.is_(False))
+        .order_by(Notification.created_at.desc())),
+    ("последние сообщения чата", lambda: select_chat_messages().where(ChatMessage.id > 0)
+        .order_by(ChatMessage.id.desc()).limit(151)),
+    ("новые сообщения чата", lambda: select_chat_messages().where(ChatMessage.id > 100)
+        .order_by(ChatMessage.id.desc()).limit(151)),
+    ("сверка окна чата", lambda: select(func.max(ChatMessage.id), func.count(ChatMessage.id))
+        .where(ChatMessage.id > 100)),
+    ("сообщения для потока чата", lambda: select_chat_messages().where(ChatMessage.id > 100)
+        .order_by(ChatMessage.id).limit(500)),
+    ("тикеты пользователя", lambda: select(Ticket).where(Ticket.user_id == 1)
+        .order_by(Ticket.created_at.desc())),
+    ("все тикеты (админка)", lambda: select(Ticket).join(User, Ticket.user_id == User.id)
+        .order_by(Ticket.created_at.desc())),
+    ("ответ администратора в тикете", lambda: select(TicketMessage)
+        .where(TicketMessage.ticket_id == 1, TicketMessage.is_admin.is_(True)).limit(1)),
+    ("файлы тикета", lambda: select(TicketFile).where(TicketFile.ticket_id == 1)),
+    ("материалы предмета по типу", lambda: select(Material)
+        .where(Material.subject_id == 1, Material.type == "lecture")),
+    ("задания с решениями", lambda: select(Material).options(joinedload(Material.submissions))
+        .where(Material.subject_id == 1, Material.type == "assignment")),
+    ("решение пользователя", lambda: select(Submission)
+        .where(Submission.user_id == 1, Submission.material_id == 1).limit(1)),
+    ("код подтверждения email", lambda: select(EmailVerification)
+        .where(EmailVerification.id == 1, EmailVerification.code == "000000",
+               EmailVerification.is_used.is_(False)).limit(1)),
+    ("коды подтверждения пользователя", lambda: select(EmailVerification)
+        .where(EmailVerification.user_id == 1)),
+    ("код восстановления пароля", lambda: select(PasswordReset)
+        .where(PasswordReset.code == "X", PasswordReset.is_used.is_(False),
+               PasswordReset.expires_at > NOW).limit(1)),
+    ("коды восстановления по email", lambda: select(PasswordReset)
+        .where(PasswordReset.email == "a@b.c", PasswordReset.is_used.is_(False))),
+    # Совпадения двух диапазонов сортируются по id страницы поиска - проверяется поиск по индексам
+    ("поиск пользователей по префиксу", lambda: select(User.id)
+        .where(or_(prefix_filter(User.username, "Iv", ignore_case=True),
+                   prefix_filter(User.email, "Iv", ignore_case=True)))),
+    ("пользователь по email", lambda: select(User).where(User.email == "a@b.c").limit(1)),
+    ("администраторы (админка)", lambda: select(User)
+        .where(User.is_admin.is_(True), User.id < 1000).order_by(User.id.desc()).limit(51)),
+    ("версия кеша коротких ссылок", lambda: select(CodeSequence.value)
+        .where(CodeSequence.name == "shortlink-cache-version")),
+    ("новые коды для фильтра кодов", lambda: select(ShortLink.id, ShortLink.code)
+        .where(ShortLink.id > 100).order_by(ShortLink.id)),
+    ("короткая ссылка по коду", lambda: select(ShortLink).where(ShortLink.code == "abc").limit(1)),
+    ("клик ссылки с лимитом", lambda: claim_click_statement("abc", NOW)),
+    ("переходы ссылок за сутки", lambda: select(ShortLinkClickHourly)
+        .where(ShortLinkClickHourly.short_link_id.in_([1, 2]), ShortLinkClickHourly.hour >= NOW)),
+    ("истекшие ссылки для архива", lambda: select(ShortLinkRule.short_link_id)
+        .where(ShortLinkRule.expires_at < NOW).limit(500)),
+    ("освобожденные коды после карантина", lambda: select(ShortLinkArchive.id)
+        .where(ShortLinkArchive.code_reused_at.is_(None), ShortLinkArchive.archived_at <= NOW)
+        .order_by(ShortLinkArchive.archived_at).limit(10)),
+    ("ссылка по URL (дедупликация)", lambda: select(ShortLink)
+        .outerjoin(ShortLinkRule, ShortLinkRule.short_link_id == ShortLink.id)
+        .where(ShortLink.url_hash.in_(["x"]), ShortLinkRule.id.is_(None)).order_by(ShortLink.id)),
+]
+
+_FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+
+
+def explain(stmt) -> List[str]:
+    """Возвращает строки плана запроса (колонка detail)."""
+    compiled = stmt.compile(dialect=db.engine.dialect, compile_kwargs={"render_postcompile": True})
+    # План не зависит от значений параметров
+    params = tuple(None for _ in compiled.positiontup or ())
+    with db.engine.connect() as connection:
+        rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params).fetchall()
+    return [row[-1] for row in rows]
+
+
+def problems(plan: List[str]) -> List[str]:
+    """Строки плана, означающие полный проход таблицы или сортировку."""
+    return [line for line in plan if _FULL_SCAN.match(line) or "USE TEMP B-TREE" in line]
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Проверка планов горячих запросов cysu")
+    parser.add_argument("--db", default=None, help="Путь к существующей БД SQLite")
+    parser.add_argument("--verbose", action="store_true", help="Печатать планы всех запросов")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str]) -> int:
+    args = parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix="cysu-plans-")
+    db_path = os.path.abspath(args.db) if args.db else os.path.join(workdir, "plans.db")
+
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{db_path}",
+        "LOG_FILE": os.path.join(workdir, "plans.log"),
+        "LOG_LEVEL": "WARNING",
+        "BACKGROUND_TASKS_ENABLED": False,
+    })
+
+    print(f"🔍 Планы горячих запросов ({db_path})")
+    print("=" * 80)
+    failed = 0
+    with app.app_context():
+        for name, build in HOT_QUERIES:
+            plan = explain(build())
+            bad = problems(plan)
+            print(f"{'❌' if bad else '✅'} {name}")
+            if bad or args.verbose:
+                for line in plan:
+                    print(f"      {line}")
+            failed += bool(bad)
+
+    print("=" * 80)
+    if failed:
+        print(f"❌ Запросов с полным сканированием или сортировкой: {failed}")
+        return 1
+    print(f"✅ Все {len(HOT_QUERIES)} запросов используют индексы")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
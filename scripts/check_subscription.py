@@ -13,7 +13,7 @@ from app.models import User
 
 def check_subscription(username):
     """Проверяет подписку пользователя"""
-    app = create_app()
+    app = create_app({"BACKGROUND_TASKS_ENABLED": False})
     
     with app.app_context():
         # Ищем пользователя по нику
@@ -6,6 +6,7 @@
     python3 scripts/clear_shortlinks.py --yes         # удалить без подтверждения
     python3 scripts/clear_shortlinks.py --dry-run     # показать, что будет удалено
     python3 scripts/clear_shortlinks.py --stats       # показать статистику и выйти
+    python3 scripts/clear_shortlinks.py --dead        # перенести в архив только истекшие/исчерпанные
 
 По умолчанию запросит подтверждение (введите YES), если флаг --yes не указан.
 """
@@ -22,7 +23,9 @@ import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app import create_app, db
-from app.models import ShortLink, ShortLinkRule
+from app.models import ShortLink, ShortLinkClick, ShortLinkClickHourly, ShortLinkRule
+from app.services.shortlink_archive import get_archive_stats, sweep_dead_links
+from app.services.shortlink_service import mark_short_links_changed
 
 
 def print_stats() -> None:
@@ -32,6 +35,8 @@ def print_stats() -> None:
     print("📊 Текущая статистика коротких ссылок:")
     print(f"   - Ссылок: {total_links}")
     print(f"   - Правил: {total_rules}")
+    archive = get_archive_stats()
+    print(f"   - В архиве: {archive['total']} (кодов ждут повторной выдачи: {archive['codes_pending']})")
     if total_links:
         print("   - Примеры (первые 5):")
         for sl in ShortLink.query.order_by(ShortLink.created_at.desc()).limit(5).all():
@@ -67,11 +72,15 @@ def clear_all(confirm: bool, dry_run: bool) -> None:
             print("❌ Операция отменена")
             sys.exit(1)
 
-    # Удаляем сначала правила, затем ссылки (bulk delete, чтобы не зависеть от каскада)
+    # Удаляем сначала правила и статистику переходов, затем ссылки
+    # (bulk delete, чтобы не зависеть от каскада). Архив не трогаем.
     from sqlalchemy import delete
 
     db.session.execute(delete(ShortLinkRule))
+    db.session.execute(delete(ShortLinkClickHourly))
+    db.session.execute(delete(ShortLinkClick))
     db.session.execute(delete(ShortLink))
+    mark_short_links_changed()
     db.session.commit()
 
     print("\n✅ Все короткие ссылки и правила удалены")
@@ -83,17 +92,27 @@ def parse_args(argv: list[str]) -> argparse.Namespace:
     parser.add_argument("--yes", action="store_true", help="Удалить без подтверждения")
     parser.add_argument("--dry-run", action="store_true", help="Показать, что будет удалено, без выполнения")
     parser.add_argument("--stats", action="store_true", help="Показать статистику и выйти")
+    parser.add_argument(
+        "--dead",
+        action="store_true",
+        help="Перенести в архив только истекшие и исчерпанные ссылки (как фоновая задача)",
+    )
     return parser.parse_args(argv)
 
 
 def main(argv: list[str]) -> NoReturn:
     args = parse_args(argv)
-    app = create_app()
+    app = create_app({"BACKGROUND_TASKS_ENABLED": False})
     with app.app_context():
         if args.stats:
             print_stats()
             sys.exit(0)
-        clear_all(confirm=args.yes, dry_run=args["dry_run"])  # type: ignore[index]
+        if args.dead:
+            moved = sweep_dead_links()
+            print(f"✅ Перенесено в архив: {moved}")
+            print_stats()
+            sys.exit(0)
+        clear_all(confirm=args.yes, dry_run=args.dry_run)
     sys.exit(0)
 
 
@@ -37,7 +37,7 @@ def clear_all_tickets() -> None:
     - Все файлы тикетов (TicketFile) 
     - Все сообщения тикетов (TicketMessage)
     """
-    app = create_app()
+    app = create_app({"BACKGROUND_TASKS_ENABLED": False})
     
     with app.app_context():
         try:
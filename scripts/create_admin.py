@@ -26,7 +26,7 @@ def init_database():
     conn.close()
     print("✅ Файл базы данных создан")
     
-    app = create_app()
+    app = create_app({"BACKGROUND_TASKS_ENABLED": False})
     
     with app.app_context():
         # Создаем все таблицы
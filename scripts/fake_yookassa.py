@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Локальная заглушка API ЮKassa для нагрузочного тестирования платежей cysu.
+
+Реализует минимум API v3, которым пользуется YooKassaService:
+    POST /v3/payments          - создание платежа (учитывает Idempotence-Key)
+    GET  /v3/payments/<id>     - статус платежа
+
+Платеж переходит в succeeded через --succeed-after секунд после создания,
+после чего (если указан --webhook-url) заглушка отправляет webhook
+payment.succeeded. Задержка и доля ошибок настраиваются, чтобы проверить
+таймауты и повторы клиента.
+
+Использование:
+    python3 scripts/fake_yookassa.py --port 8090 --latency-ms 80 --jitter-ms 40 --error-rate 0.05
+    YOOKASSA_API_URL=http://127.0.0.1:8090/v3 YOOKASSA_SHOP_ID=test YOOKASHA_SECRET_KEY=test python3 run.py
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+
+import requests
+
+
+class FakeYooKassaState:
+    """Хранилище платежей и настройки поведения заглушки."""
+
+    def __init__(
+        self,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        error_rate: float = 0.0,
+        hang_rate: float = 0.0,
+        hang_ms: float = 30000.0,
+        succeed_after: float = 0.0,
+        webhook_url: Optional[str] = None,
+    ) -> None:
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.hang_rate = hang_rate
+        self.hang_ms = hang_ms
+        self.succeed_after = succeed_after
+        self.webhook_url = webhook_url
+        self.payments: Dict[str, Dict[str, Any]] = {}
+        self.idempotence: Dict[str, str] = {}
+        self.stats = {"requests": 0, "errors": 0, "hangs": 0, "webhooks": 0}
+        self.lock = threading.Lock()
+
+    def delay(self) -> None:
+        """Имитирует сетевую задержку и «зависание» ответа."""
+        if self.hang_rate and random.random() < self.hang_rate:
+            with self.lock:
+                self.stats["hangs"] += 1
+            time.sleep(self.hang_ms / 1000)
+            return
+        latency = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        if latency > 0:
+            time.sleep(latency / 1000)
+
+    def should_fail(self) -> bool:
+        with self.lock:
+            self.stats["requests"] += 1
+            if self.error_rate and random.random() < self.error_rate:
+                self.stats["errors"] += 1
+                return True
+        return False
+
+    def create_payment(self, data: Dict[str, Any], idempotence_key: str) -> Dict[str, Any]:
+        with self.lock:
+            existing = self.idempotence.get(idempotence_key)
+            if existing:
+                return self.payments[existing]
+            payment_id = str(uuid.uuid4())
+            payment = {
+                "id": payment_id,
+                "status": "pending",
+                "paid": False,
+                "amount": data.get("amount", {}),
+                "description": data.get("description"),
+                "metadata": data.get("metadata", {}),
+                "created_at": datetime.utcnow().isoformat() + "Z",
+                "confirmation": {
+                    "type": "redirect",
+                    "confirmation_url": f"http://fake-yookassa.local/checkout/{payment_id}",
+                },
+                "_created": time.monotonic(),
+            }
+            self.payments[payment_id] = payment
+            if idempotence_key:
+                self.idempotence[idempotence_key] = payment_id
+
+        if self.succeed_after >= 0:
+            timer = threading.Timer(self.succeed_after, self.succeed_payment, args=(payment_id,))
+            timer.daemon = True
+            timer.start()
+        return payment
+
+    def succeed_payment(self, payment_id: str) -> None:
+        with self.lock:
+            payment = self.payments.get(payment_id)
+            if not payment or payment["status"] == "succeeded":
+                return
+            payment["status"] = "succeeded"
+            payment["paid"] = True
+        if self.webhook_url:
+            self.send_webhook("payment.succeeded", payment)
+
+    def send_webhook(self, event: str, payment: Dict[str, Any]) -> None:
+        body = {"type": "notification", "event": event, "object": public_payment(payment)}
+        try:
+            requests.post(self.webhook_url, json=body, timeout=5)
+            with self.lock:
+                self.stats["webhooks"] += 1
+        except requests.exceptions.RequestException as e:
+            print(f"⚠️  Webhook не доставлен: {e}", file=sys.stderr)
+
+
+def public_payment(payment: Dict[str, Any]) -> Dict[str, Any]:
+    """Платеж без служебных полей заглушки."""
+    return {k: v for k, v in payment.items() if not k.startswith("_")}
+
+
+def make_handler(state: FakeYooKassaState):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, как у настоящего API
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+        def _send(self, status: int, body: Dict[str, Any]) -> None:
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _prologue(self) -> bool:
+            state.delay()
+            if not self.headers.get("Authorization", "").startswith("Basic "):
+                self._send(401, {"type": "error", "code": "invalid_credentials"})
+                return False
+            if state.should_fail():
+                self._send(500, {"type": "error", "code": "internal_server_error"})
+                return False
+            return True
+
+        def do_POST(self) -> None:
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            if not self._prologue():
+                return
+            if self.path.rstrip("/") != "/v3/payments":
+                self._send(404, {"type": "error", "code": "not_found"})
+                return
+            try:
+                data = json.loads(raw or b"{}")
+            except ValueError:
+                self._send(400, {"type": "error", "code": "invalid_request"})
+                return
+            payment = state.create_payment(data, self.headers.get("Idempotence-Key", ""))
+            self._send(200, public_payment(payment))
+
+        def do_GET(self) -> None:
+            if not self._prologue():
+                return
+            prefix = "/v3/payments/"
+            if not self.path.startswith(prefix):
+                self._send(404, {"type": "error", "code": "not_found"})
+                return
+            payment = state.payments.get(self.path[len(prefix):])
+            if not payment:
+                self._send(404, {"type": "error", "code": "not_found"})
+                return
+            self._send(200, public_payment(payment))
+
+    return Handler
+
+
+def start_server(host: str = "127.0.0.1", port: int = 0, **options: Any) -> Tuple[ThreadingHTTPServer, FakeYooKassaState]:
+    """Запускает заглушку в фоновом потоке. Возвращает (сервер, состояние)."""
+    state = FakeYooKassaState(**options)
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-yookassa", daemon=True).start()
+    return server, state
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Локальная заглушка API ЮKassa")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Средняя задержка ответа")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Разброс задержки (±)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ответов 500 (0..1)")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="Доля «зависших» ответов (0..1)")
+    parser.add_argument("--hang-ms", type=float, default=30000.0, help="Длительность «зависания»")
+    parser.add_argument("--succeed-after", type=float, default=1.0,
+                        help="Через сколько секунд платеж становится succeeded (-1 - никогда)")
+    parser.add_argument("--webhook-url", default=None,
+                        help="URL для webhook payment.succeeded, например http://127.0.0.1:8001/payment/webhook")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str]) -> None:
+    args = parse_args(argv)
+    server, state = start_server(
+        args.host,
+        args.port,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        hang_rate=args.hang_rate,
+        hang_ms=args.hang_ms,
+        succeed_after=args.succeed_after,
+        webhook_url=args.webhook_url,
+    )
+    host, port = server.server_address[:2]
+    print(f"🧪 Заглушка ЮKassa запущена: http://{host}:{port}/v3")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"   {state.stats}")
+    except KeyboardInterrupt:
+        print("\n🛑 Остановка")
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -13,7 +13,7 @@ from app.models import User
 
 def grant_subscription(username):
     """Выдает подписку пользователю до 99 года"""
-    app = create_app()
+    app = create_app({"BACKGROUND_TASKS_ENABLED": False})
     
     with app.app_context():
         # Ищем пользователя по нику
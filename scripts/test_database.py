@@ -24,7 +24,7 @@ def test_database():
     print("🗄️ ТЕСТИРОВАНИЕ БАЗЫ ДАННЫХ EDUFLOW")
     print("=" * 60)
 
-    app = create_app()
+    app = create_app({"BACKGROUND_TASKS_ENABLED": False})
 
     with app.app_context():
         try:
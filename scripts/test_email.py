@@ -25,7 +25,7 @@ def test_email_service():
     print("📧 ТЕСТИРОВАНИЕ EMAIL СЕРВИСА EDUFLOW")
     print("=" * 60)
     
-    app = create_app()
+    app = create_app({"BACKGROUND_TASKS_ENABLED": False})
     
     with app.app_context():
         try:
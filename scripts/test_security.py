@@ -29,7 +29,7 @@ from scripts.test_utils import global_cleanup
 
 def test_security():
     """Тестирует безопасность системы"""
-    app = create_app()
+    app = create_app({"BACKGROUND_TASKS_ENABLED": False})
     
     with app.app_context():
         print("🔒 Тестирование безопасности cysu")
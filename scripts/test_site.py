@@ -33,7 +33,7 @@ from scripts.test_utils import global_cleanup
 
 def test_site_functionality() -> None:
     """Тестирует основные функции сайта"""
-    app = create_app()
+    app = create_app({"BACKGROUND_TASKS_ENABLED": False})
     
     with app.app_context():
         print("🌐 Тестирование сайта cysu")
@@ -24,7 +24,7 @@ from datetime import datetime
 
 def global_cleanup() -> None:
     """Глобальная очистка всех тестовых данных"""
-    app = create_app()
+    app = create_app({"BACKGROUND_TASKS_ENABLED": False})
     
     with app.app_context():
         print("🧹 ГЛОБАЛЬНАЯ ОЧИСТКА ТЕСТОВЫХ ДАННЫХ")
@@ -248,7 +248,7 @@ def cleanup_temp_files() -> None:
 
 def get_test_statistics() -> dict:
     """Получает статистику тестовых данных"""
-    app = create_app()
+    app = create_app({"BACKGROUND_TASKS_ENABLED": False})
     
     with app.app_context():
         stats = {